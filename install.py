@@ -7,9 +7,25 @@ import logging
 import subprocess
 import shutil
 import json
+import tempfile
+import time
+import importlib.util
 
 SCRIPT_NAME = "xclip-ocr.py"
 USER_HOME = os.path.expanduser("~")
+PROFILE_PATH = os.path.join(USER_HOME, ".config", "xclip-ocr", "profile.json")
+FONT_DIR = "/usr/share/fonts/truetype/dejavu"
+
+# Synthetic calibration corpus: (text, font file, size, canvas, layout)
+CALIBRATION_SAMPLES = [
+    ("The quick brown fox jumps over the lazy dog\nPack my box with five dozen liquor jugs\n"
+     "Sphinx of black quartz judge my vow", "DejaVuSans.ttf", 16, (620, 110), "block"),
+    ("Save changes before closing", "DejaVuSans.ttf", 11, (260, 24), "line"),
+    ("File Edit View Search Terminal Help", "DejaVuSans.ttf", 14, (520, 260), "sparse"),
+    ("def parse(line):\n    key, value = line.split(\"=\", 1)\n    return key.strip(), value",
+     "DejaVuSansMono.ttf", 13, (520, 90), "block"),
+    ("Quarterly Report 2024", "DejaVuSans.ttf", 28, (420, 50), "line"),
+]
 
 # configure logging
 logging.basicConfig(level=logging.INFO, format='[%(levelname)s] %(message)s')
@@ -94,6 +110,135 @@ def unbind_hotkey_cinnamon(script_path):
     logging.info("Hotkey unbound.")
     return True
 
+def load_runtime(script_path):
+    spec = importlib.util.spec_from_file_location("xclip_ocr", script_path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def create_calibration_corpus(directory):
+    from PIL import Image, ImageDraw, ImageFont
+
+    corpus = []
+    for i, (text, font_file, size, canvas, layout) in enumerate(CALIBRATION_SAMPLES):
+        try:
+            font = ImageFont.truetype(os.path.join(FONT_DIR, font_file), size)
+        except OSError:
+            font = ImageFont.load_default()
+        img = Image.new('RGB', canvas, 'white')
+        draw = ImageDraw.Draw(img)
+        if layout == "sparse":
+            # Menu-like words scattered across the canvas
+            for j, word in enumerate(text.split()):
+                draw.text((10 + (j % 3) * 170, 10 + (j // 3) * 120), word, fill="black", font=font)
+        else:
+            draw.multiline_text((8, 6), text, fill="black", font=font, spacing=6)
+        path = os.path.join(directory, f"sample{i}.png")
+        img.save(path)
+        corpus.append((path, text))
+    return corpus
+
+def score_text(expected, found):
+    words = expected.split()
+    return sum(1 for word in words if word in found) / len(words)
+
+def run_corpus(ocr, corpus, config, work_dir, preprocess=True):
+    """
+    Run the runtime pipeline over the corpus; returns (seconds, accuracy)
+    """
+    ocr.configure_threads(config)
+    elapsed = 0.0
+    accuracy = 0.0
+    for path, expected in corpus:
+        work_path = os.path.join(work_dir, "work.png")
+        shutil.copy(path, work_path)
+        start = time.perf_counter()
+        if preprocess:
+            ocr.enhance_image_for_ocr(work_path, config)
+        text = ocr.run_ocr_with_best_settings(work_path, None, config)
+        elapsed += time.perf_counter() - start
+        accuracy += score_text(expected, text)
+    return elapsed, accuracy / len(corpus)
+
+def calibrate(script_path, profile_path=PROFILE_PATH):
+    """
+    Benchmark the OCR stages on a synthetic corpus and write a tuned profile
+    """
+    if not shutil.which("tesseract"):
+        logging.warning("tesseract not found; skipping calibration.")
+        return None
+    try:
+        ocr = load_runtime(script_path)
+    except ImportError as e:
+        logging.warning(f"Cannot load {script_path} for calibration ({e}); skipping.")
+        return None
+
+    cpus = os.cpu_count() or 1
+    config = dict(ocr.DEFAULT_CONFIG, thread_budget=cpus, post_correction=False,
+                  history_enabled=False)
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        corpus = create_calibration_corpus(work_dir)
+        logging.info(f"Calibrating on {len(corpus)} synthetic samples, {cpus} CPU(s)...")
+
+        # OMP threads per Tesseract process, measured on a single config
+        timings = {}
+        for threads in sorted({1, 2, 4, cpus}):
+            if threads > cpus:
+                continue
+            trial = dict(config, omp_thread_limit=threads, ocr_psm_order=[6])
+            timings[threads], _ = run_corpus(ocr, corpus, trial, work_dir)
+            logging.info(f"  OMP_THREAD_LIMIT={threads}: {timings[threads]:.2f}s")
+        # Prefer fewer threads unless more are clearly faster
+        fastest = min(timings.values())
+        config["omp_thread_limit"] = min(t for t, sec in timings.items() if sec <= fastest * 1.1)
+
+        # Config order: most accurate first, faster breaking ties
+        psm_scores = []
+        for psm in ocr.DEFAULT_CONFIG["ocr_psm_order"]:
+            elapsed, accuracy = run_corpus(ocr, corpus, dict(config, ocr_psm_order=[psm]), work_dir)
+            psm_scores.append((-round(accuracy, 2), elapsed, psm))
+            logging.info(f"  PSM {psm}: accuracy {accuracy:.0%}, {elapsed:.2f}s")
+        config["ocr_psm_order"] = [psm for _, _, psm in sorted(psm_scores)]
+
+        # Parallel configs, within the thread budget
+        timings = {}
+        for workers in range(1, min(4, cpus // config["omp_thread_limit"]) + 1):
+            timings[workers], _ = run_corpus(ocr, corpus, dict(config, ocr_workers=workers), work_dir)
+            logging.info(f"  {workers} worker(s): {timings[workers]:.2f}s")
+        fastest = min(timings.values())
+        config["ocr_workers"] = min(w for w, sec in timings.items() if sec <= fastest * 1.1)
+
+        # Upscaling thresholds: best accuracy per second
+        best = None
+        for width, height in [(300, 150), (400, 200), (600, 300)]:
+            trial = dict(config, upscale_min_width=width, upscale_min_height=height)
+            elapsed, accuracy = run_corpus(ocr, corpus, trial, work_dir)
+            logging.info(f"  upscale below {width}x{height}: accuracy {accuracy:.0%}, {elapsed:.2f}s")
+            key = (-round(accuracy, 2), elapsed)
+            if best is None or key < best[0]:
+                best = (key, width, height)
+        config["upscale_min_width"], config["upscale_min_height"] = best[1], best[2]
+
+        # Grayscale chain vs local adaptive binarization
+        best = None
+        for method in ("none", "sauvola", "wolf"):
+            elapsed, accuracy = run_corpus(ocr, corpus, dict(config, binarization=method), work_dir)
+            logging.info(f"  binarization {method}: accuracy {accuracy:.0%}, {elapsed:.2f}s")
+            key = (-round(accuracy, 2), elapsed)
+            if best is None or key < best[0]:
+                best = (key, method)
+        config["binarization"] = best[1]
+
+    profile = {key: config[key] for key in (
+        "omp_thread_limit", "ocr_workers", "thread_budget", "ocr_psm_order",
+        "upscale_min_width", "upscale_min_height", "binarization")}
+    os.makedirs(os.path.dirname(profile_path), exist_ok=True)
+    with open(profile_path, "w") as f:
+        json.dump(profile, f, indent=2)
+    logging.info(f"Tuned profile written to {profile_path}: {profile}")
+    return profile
+
 def print_manual_instructions():
     logging.info("Manual hotkey setup:")
     logging.info("1. Open Keyboard Shortcuts in your DE settings.")
@@ -106,6 +251,8 @@ def main():
     parser.add_argument("--install-dir", default=os.path.join(USER_HOME, '.local', 'bin'), help="Installation directory")
     parser.add_argument("--pkg-manager", choices=["apt", "dnf", "pacman"], default=None, help="Package manager to use")
     parser.add_argument("--uninstall", action="store_true", help="Uninstall script and hotkey")
+    parser.add_argument("--calibrate", action="store_true", help="Only re-run hardware calibration")
+    parser.add_argument("--skip-calibration", action="store_true", help="Install without calibrating")
     args = parser.parse_args()
 
     install_dir = args.install_dir
@@ -123,10 +270,16 @@ def main():
             unbind_hotkey_cinnamon(script_path)
         sys.exit(0)
 
+    if args.calibrate:
+        calibrate(script_path if os.path.exists(script_path) else SCRIPT_NAME)
+        sys.exit(0)
+
     logging.info("Starting installation of xclip-ocr...")
     install_dependencies(args.pkg_manager)
     installed_path = copy_script(install_dir)
     logging.info(f"Installed at {installed_path}")
+    if not args.skip_calibration:
+        calibrate(installed_path)
     # bind hotkey
     if "cinnamon" in de:
         bind_hotkey_cinnamon(installed_path)
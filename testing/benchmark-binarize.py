@@ -0,0 +1,52 @@
+#!/usr/bin/python3
+"""
+Compare the grayscale preprocessing chain with Sauvola and Wolf
+binarization on the calibration corpus, plus copies of it on uneven
+backgrounds (gradient, tinted panel, highlighted row)
+"""
+
+import os
+import sys
+import tempfile
+import numpy as np
+from PIL import Image
+from benchmark_common import load_script, run_corpus, stage_config
+
+def uneven(path, dest):
+    """Multiply a light-background sample by a gradient, a tinted panel and a highlight bar"""
+    a = np.asarray(Image.open(path).convert('RGB'), dtype=np.float64)
+    h, w = a.shape[:2]
+    shade = np.linspace(1.0, 0.7, w)[None, :, None] * np.ones((h, 1, 3))
+    shade[:, : w // 3] *= np.array([0.85, 0.9, 1.0])
+    shade[h // 3: h // 3 + max(8, h // 6)] *= np.array([0.75, 0.85, 1.0])
+    Image.fromarray((a * shade).astype(np.uint8)).save(dest)
+
+def main():
+    install = load_script("install", "install.py")
+    ocr = load_script()
+    windows = [int(v) for v in sys.argv[1:]] or [31]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        corpus = install.create_calibration_corpus(tmp)
+        for i, (path, text) in enumerate(list(corpus)):
+            dest = os.path.join(tmp, f"uneven{i}.png")
+            uneven(path, dest)
+            corpus.append((dest, text))
+
+        trials = [("none", None)] + [(method, window) for method in ("sauvola", "wolf")
+                                     for window in windows]
+        for method, window in trials:
+            config = stage_config(ocr, binarization=method)
+            if window:
+                config["binarize_window"] = window
+            results = run_corpus(ocr, corpus, config, tmp)
+            n = len(results)
+            label = method if not window else f"{method} w={window}"
+            print(f"{label:>14}: accuracy {sum(r['accuracy'] for r in results) / n:.0%}, "
+                  f"preprocess {sum(r['preprocess'] for r in results) * 1000:.0f} ms, "
+                  f"total {sum(r['total'] for r in results):.2f}s, "
+                  f"{sum(r['stats'].get('configs_tried', 0) for r in results) / n:.1f} "
+                  f"config(s)/sample")
+
+if __name__ == "__main__":
+    main()
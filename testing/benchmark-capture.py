@@ -0,0 +1,91 @@
+#!/usr/bin/python3
+"""
+Capture-stage latency per backend: grabbing a fixed region to the capture
+file, and loading that file back as preprocessing does. Runs against
+$DISPLAY, or starts Xvfb when there is none.
+"""
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from PIL import Image, ImageDraw
+from benchmark_common import load_script
+
+REGIONS = ["600x120+40+40", "1280x720+0+0", "1920x1080+0+0"]
+RUNS = 10
+
+def start_xvfb():
+    if os.environ.get("DISPLAY"):
+        return None
+    if not shutil.which("Xvfb"):
+        sys.exit("No $DISPLAY and no Xvfb to start")
+    proc = subprocess.Popen(["Xvfb", ":99", "-screen", "0", "1920x1080x24"],
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    os.environ["DISPLAY"] = ":99"
+    time.sleep(1)
+    return proc
+
+def paint_root():
+    """Fill the root window with lines of text so PNG encoding has real work"""
+    try:
+        from Xlib import X, display
+    except ImportError:
+        return
+    img = Image.new('RGB', (1920, 1080), (250, 250, 250))
+    draw = ImageDraw.Draw(img)
+    for y in range(8, 1080, 18):
+        draw.text((8, y), "def capture(region): return backend.grab(region) # latency " * 6,
+                  fill=(30, 30, 30))
+    b, g, r = img.split()[::-1]
+    data = Image.merge('RGBA', (b, g, r, Image.new('L', img.size, 0))).tobytes()
+    d = display.Display()
+    root = d.screen().root
+    gc = root.create_gc()
+    rows = 64
+    for y in range(0, 1080, rows):
+        chunk = data[y * 1920 * 4:(y + rows) * 1920 * 4]
+        root.put_image(gc, 0, y, 1920, len(chunk) // (1920 * 4), X.ZPixmap, 24, 0, chunk)
+    d.sync()
+
+def measure(backend, geometry, tmp):
+    path = os.path.join(tmp, "capture" + backend.suffix)
+    grabs, loads = [], []
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        backend.grab(geometry, path)
+        grabs.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        with Image.open(path) as img:
+            img.load()
+        loads.append(time.perf_counter() - start)
+    grabs.sort()
+    return (sum(grabs) / RUNS, grabs[int(RUNS * 0.95) - 1], sum(loads) / RUNS,
+            os.path.getsize(path))
+
+def main():
+    ocr = load_script()
+    xvfb = start_xvfb()
+    try:
+        paint_root()
+        with tempfile.TemporaryDirectory() as tmp:
+            for name, backend_class in ocr.CAPTURE_BACKENDS.items():
+                try:
+                    backend = backend_class()
+                    backend.grab(REGIONS[0], os.path.join(tmp, "probe" + backend.suffix))
+                except Exception as e:
+                    print(f"{name:>9}: unavailable ({e})")
+                    continue
+                for geometry in REGIONS:
+                    grab, p95, load, size = measure(backend, geometry, tmp)
+                    print(f"{name:>9} {geometry:>14}: grab {grab * 1000:.1f} ms "
+                          f"(p95 {p95 * 1000:.1f}), load {load * 1000:.1f} ms, "
+                          f"{size / 1024:.0f} KB file")
+    finally:
+        if xvfb:
+            xvfb.terminate()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+#!/usr/bin/python3
+"""
+Compare OCR time, configs tried and accuracy on colourful captures with
+plain luma conversion and with per-region channel selection
+"""
+
+import os
+import tempfile
+from PIL import Image, ImageDraw
+from benchmark_common import load_font, load_script, run_corpus, stage_config
+
+def create_bands(path, bands, width=700, height=50):
+    """One line of text per (background, foreground, text) band; returns the expected text"""
+    img = Image.new('RGB', (width, height * len(bands)), 'white')
+    draw = ImageDraw.Draw(img)
+    for i, (background, foreground, text) in enumerate(bands):
+        draw.rectangle([0, i * height, width, (i + 1) * height], fill=background)
+        draw.text((10, i * height + 14), text, fill=foreground, font=load_font())
+    img.save(path)
+    return " ".join(text for _, _, text in bands)
+
+def main():
+    ocr = load_script()
+    with tempfile.TemporaryDirectory() as tmp:
+        corpus = {
+            "banners": [((200, 30, 30), (255, 255, 255), "Error connection refused by host"),
+                        ((255, 255, 255), (20, 60, 200), "Blue link to documentation page"),
+                        ((250, 200, 40), (40, 40, 40), "Warning disk almost full")],
+            # Foreground and background have (nearly) the same luma
+            "equal-luma": [((0, 150, 0), (255, 0, 0), "Red on green with equal luma"),
+                           ((120, 120, 120), (40, 140, 255), "Blue on grey status message"),
+                           ((200, 0, 200), (60, 160, 60), "Green on magenta button label")],
+            "syntax": [((40, 42, 54), (255, 121, 198), "def parse line return"),
+                       ((40, 42, 54), (139, 233, 253), "value equals key split"),
+                       ((40, 42, 54), (98, 114, 164), "faint comment text here"),
+                       ((40, 42, 54), (80, 250, 123), "string literal hello world")],
+        }
+        samples = []
+        for name, bands in corpus.items():
+            path = os.path.join(tmp, f"{name}.png")
+            samples.append((path, create_bands(path, bands)))
+
+        for selection in (False, True):
+            config = stage_config(ocr, channel_selection=selection)
+            for result in run_corpus(ocr, samples, config, tmp):
+                name = os.path.splitext(os.path.basename(result["path"]))[0]
+                print(f"{'channels' if selection else 'luma':>8} {name:>10}: "
+                      f"accuracy {result['accuracy']:.0%}, "
+                      f"preprocess {result['preprocess'] * 1000:.0f} ms, "
+                      f"total {result['total']:.2f}s, "
+                      f"{result['stats'].get('configs_tried', 0)} config(s)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+#!/usr/bin/python3
+"""
+Scroll through a synthetic log one screen at a time and compare OCR time
+and recognised lines with and without the line cache
+"""
+
+import os
+import tempfile
+import time
+from PIL import Image, ImageDraw
+from benchmark_common import load_script
+
+LOG = [f"2024-05-{day:02d} 12:{minute:02d}:07 INFO worker-{minute % 4} processed batch "
+       f"{day * 60 + minute} in {minute * 13 % 997} ms"
+       for day in range(1, 4) for minute in range(60)]
+SCREEN_LINES = 30
+SCROLL_LINES = 3
+
+def render_screen(path, first):
+    img = Image.new('RGB', (900, SCREEN_LINES * 20 + 10), (30, 30, 30))
+    draw = ImageDraw.Draw(img)
+    for row, line in enumerate(LOG[first:first + SCREEN_LINES]):
+        draw.text((8, 6 + row * 20), line, fill=(220, 220, 220))
+    img.save(path)
+
+def scroll(ocr, config, tmp, screens):
+    elapsed = 0
+    for screen in range(screens):
+        path = os.path.join(tmp, f"screen{screen}.png")
+        render_screen(path, screen * SCROLL_LINES)
+        start = time.perf_counter()
+        ocr.ocr_image(path, config, {}, {})
+        elapsed += time.perf_counter() - start
+    return elapsed
+
+def main():
+    ocr = load_script()
+    screens = (len(LOG) - SCREEN_LINES) // SCROLL_LINES
+    with tempfile.TemporaryDirectory() as tmp:
+        ocr.LINE_CACHE_DB = os.path.join(tmp, "lines.db")
+        ocr.STATS_PATH = os.path.join(tmp, "stats.json")
+        config = ocr.apply_content_mode(dict(ocr.DEFAULT_CONFIG, speculative_raw=False), "text")
+
+        elapsed = scroll(ocr, dict(config, line_cache=False), tmp, screens)
+        print(f"  no cache: {screens} screens in {elapsed:.2f}s "
+              f"({elapsed / screens * 1000:.0f} ms/screen)")
+
+        elapsed = scroll(ocr, config, tmp, screens)
+        totals = ocr.record_stats()
+        print(f"line cache: {screens} screens in {elapsed:.2f}s "
+              f"({elapsed / screens * 1000:.0f} ms/screen), "
+              f"{totals.get('line_cache_hits', 0)}/{totals.get('line_cache_lines', 0)} "
+              f"lines from cache")
+
+if __name__ == "__main__":
+    main()
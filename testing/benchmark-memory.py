@@ -0,0 +1,90 @@
+#!/usr/bin/python3
+"""
+Compare peak memory of the standard and memory-bounded preprocessing paths
+on a synthetic multi-monitor sized capture
+"""
+
+import subprocess
+import os
+import sys
+import tempfile
+from PIL import Image, ImageDraw
+from benchmark_common import SCRIPT
+
+# Runs in a fresh interpreter so each mode's peak RSS is measured in isolation
+RUNNER = """
+import importlib.util, json, sys
+spec = importlib.util.spec_from_file_location("xclip_ocr", sys.argv[1])
+ocr = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(ocr)
+config = dict(ocr.DEFAULT_CONFIG)
+if sys.argv[3] == "bounded":
+    config["bounded_min_pixels"] = 1
+    config["max_preprocess_rss_mb"] = 1 << 20
+    peaks = ocr.enhance_image_bounded(sys.argv[2], config)
+    print(json.dumps({"peak_mb": round(max(peaks.values()), 1),
+                      "stages": {k: round(v, 1) for k, v in peaks.items()}}))
+elif sys.argv[3] == "light":
+    # First pass of the model cascade, with the default bounded threshold
+    ocr.enhance_image_for_ocr(sys.argv[2], config, light=True, dest=sys.argv[2] + ".light.png")
+    print(json.dumps({"peak_mb": round(ocr.peak_rss_mb(), 1)}))
+elif sys.argv[3] == "linecache":
+    # Line cache with every other line cached: the misses get a light pass
+    ocr.STATS_PATH = sys.argv[2] + ".stats.json"
+    config = ocr.apply_content_mode(config, "text")
+    cache = ocr.LineCache(config, sys.argv[2] + ".lines.db")
+    cache._segment(sys.argv[2])
+    cache._store([(key, "cached", 90.0) for key in cache.keys[::2]])
+    ocr.reset_peak_rss()
+    cache.recognize(sys.argv[2], {})
+    cache.close()
+    print(json.dumps({"peak_mb": round(ocr.peak_rss_mb(), 1)}))
+else:
+    config["bounded_min_pixels"] = 1 << 62
+    ocr.enhance_image_for_ocr(sys.argv[2], config)
+    print(json.dumps({"peak_mb": round(ocr.peak_rss_mb(), 1)}))
+"""
+
+def create_large_capture(path, width=7680, height=2160):
+    """Three 4K-wide panels of small UI text"""
+    img = Image.new('RGB', (width, height), 'white')
+    draw = ImageDraw.Draw(img)
+    for y in range(10, height, 18):
+        draw.text((10, y), "def handler(request): return render(request, 'index.html') " * 20,
+                  fill="black")
+    img.save(path)
+
+def measure(mode, image_path):
+    with tempfile.NamedTemporaryFile(suffix=".png", delete=False) as temp_file:
+        work_path = temp_file.name
+    try:
+        with open(image_path, 'rb') as src, open(work_path, 'wb') as dst:
+            dst.write(src.read())
+        result = subprocess.run(
+            [sys.executable, "-c", RUNNER, SCRIPT, work_path, mode],
+            capture_output=True,
+            text=True,
+            check=True
+        )
+        return result.stdout.strip()
+    finally:
+        for path in (work_path, work_path + ".light.png", work_path + ".stats.json",
+                     work_path + ".lines.db", work_path + ".stats.json.lock"):
+            if os.path.exists(path):
+                os.remove(path)
+
+def main():
+    with tempfile.NamedTemporaryFile(suffix=".png", delete=False) as temp_file:
+        image_path = temp_file.name
+
+    try:
+        print("Creating 7680x2160 test capture...")
+        create_large_capture(image_path)
+
+        for mode in ("standard", "bounded", "light", "linecache"):
+            print(f"{mode:>9}: {measure(mode, image_path)}")
+    finally:
+        os.remove(image_path)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+#!/usr/bin/python3
+"""
+Benchmark OCR post-correction cost per kilobyte of text
+"""
+
+import os
+import random
+import sys
+import tempfile
+import time
+from benchmark_common import load_script
+
+SAMPLE = """The quick brown fox jumps over the lazy dog while the modern server
+returns an error code for every request in the table. Open the file list,
+click the first line and print the value of each column to check the data.
+def read_config(path): return json.load(open(path)) # utf8 sha256 x11
+Total: 2024 items, 128 errors, 1337 warnings in 42 files.
+"""
+
+def corrupt(text, rate=0.05):
+    """Inject typical Tesseract confusions into a fraction of the words"""
+    swaps = [("l", "1"), ("o", "0"), ("m", "rn"), ("I", "|"), ("0", "O")]
+    words = text.split(" ")
+    for i, word in enumerate(words):
+        if random.random() < rate:
+            old, new = random.choice(swaps)
+            words[i] = word.replace(old, new, 1)
+    return " ".join(words)
+
+def main():
+    ocr = load_script()
+    random.seed(1)
+    words_path = sys.argv[1] if len(sys.argv) > 1 else "/usr/share/dict/words"
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if not os.path.exists(words_path):
+            # No system word list: index the sample's own vocabulary
+            words_path = os.path.join(tmp, "words")
+            with open(words_path, "w") as f:
+                f.write("\n".join(set(SAMPLE.lower().split())))
+
+        db_path = os.path.join(tmp, "dictionary.db")
+        start = time.perf_counter()
+        count = ocr.build_dictionary_index(words_path, db_path, os.path.join(tmp, "none.db"))
+        print(f"Index build: {count} words in {time.perf_counter() - start:.2f}s")
+
+        for size_kb in (1, 16, 256):
+            text = corrupt(SAMPLE * (size_kb * 1024 // len(SAMPLE) + 1))[:size_kb * 1024]
+            runs = max(1, 64 // size_kb)
+            elapsed = 0
+            for _ in range(runs):
+                # Fresh corrector per run so the token cache starts cold
+                corrector = ocr.PostCorrector(db_path)
+                start = time.perf_counter()
+                ocr.clean_ocr_text(text, corrector)
+                elapsed += time.perf_counter() - start
+                corrector.close()
+            elapsed /= runs
+            print(f"{size_kb:>4} KB: {elapsed * 1000:.3f} ms total, "
+                  f"{elapsed * 1000 / size_kb:.3f} ms/KB, "
+                  f"{corrector.corrections} corrections")
+
+if __name__ == "__main__":
+    main()
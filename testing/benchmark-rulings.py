@@ -0,0 +1,63 @@
+#!/usr/bin/python3
+"""
+Compare OCR time, configs tried and accuracy on tabular captures with and
+without ruling-line removal
+"""
+
+import os
+import tempfile
+from PIL import Image, ImageDraw
+from benchmark_common import load_font, load_script, run_corpus, stage_config
+
+def create_table(path, rows, cols, cell=(150, 34), color=(120, 120, 120), size=14):
+    """Spreadsheet-like grid with one word per cell; returns the expected words"""
+    font = load_font(size)
+    img = Image.new('RGB', (cols * cell[0] + 20, rows * cell[1] + 20), 'white')
+    draw = ImageDraw.Draw(img)
+    words = []
+    for r in range(rows):
+        for c in range(cols):
+            x, y = 10 + c * cell[0], 10 + r * cell[1]
+            draw.rectangle([x, y, x + cell[0], y + cell[1]], outline=color)
+            word = f"Value{r * cols + c}"
+            draw.text((x + 8, y + 8), word, fill="black", font=font)
+            words.append(word)
+    img.save(path)
+    return " ".join(words)
+
+def create_form(path):
+    """Labels with underlined input fields and a separator, like a settings dialog"""
+    font = load_font(13)
+    labels = ["Name", "Email", "Company", "Address", "Phone"]
+    img = Image.new('RGB', (520, 40 * len(labels) + 40), (245, 245, 245))
+    draw = ImageDraw.Draw(img)
+    for i, label in enumerate(labels):
+        y = 20 + i * 40
+        draw.text((16, y), label, fill="black", font=font)
+        draw.line([(120, y + 18), (500, y + 18)], fill=(90, 90, 90))
+    draw.line([(0, 10), (520, 10)], fill=(60, 60, 60), width=2)
+    img.save(path)
+    return " ".join(labels)
+
+def main():
+    ocr = load_script()
+    with tempfile.TemporaryDirectory() as tmp:
+        corpus = [
+            (os.path.join(tmp, "table.png"), create_table(os.path.join(tmp, "table.png"), 8, 4)),
+            (os.path.join(tmp, "grid.png"), create_table(os.path.join(tmp, "grid.png"), 12, 6,
+                                                         (110, 26), (0, 0, 0), 12)),
+            (os.path.join(tmp, "form.png"), create_form(os.path.join(tmp, "form.png"))),
+        ]
+        for removal in (False, True):
+            config = stage_config(ocr, ruling_removal=removal)
+            for result in run_corpus(ocr, corpus, config, tmp):
+                print(f"{'removal' if removal else 'as is':>8} "
+                      f"{os.path.basename(result['path']):>10}: "
+                      f"accuracy {result['accuracy']:.0%}, "
+                      f"preprocess {result['preprocess'] * 1000:.0f} ms, "
+                      f"total {result['total']:.2f}s, "
+                      f"{result['stats'].get('configs_tried', 0)} config(s), "
+                      f"{result['text'].count('|')} '|'")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+#!/usr/bin/python3
+"""
+Scroll through a long synthetic page and compare OCR work and time for
+full-frame OCR of every frame against the scroll stitcher, which OCRs only
+the newly revealed strips
+"""
+
+import os
+import tempfile
+import time
+import numpy as np
+from PIL import Image, ImageDraw
+from benchmark_common import load_font, load_script
+
+LINES = [f"Paragraph {i}: the scheduler moved {i * 7} jobs to worker {i % 5}" for i in range(150)]
+FRAME_HEIGHT = 480
+HEADER = 30
+
+def render_page():
+    font = load_font(15)
+    img = Image.new('RGB', (700, len(LINES) * 21 + 40), 'white')
+    draw = ImageDraw.Draw(img)
+    for i, line in enumerate(LINES):
+        draw.text((10, HEADER + 8 + i * 21), line, fill="black", font=font)
+    return np.asarray(img)
+
+def frame_at(page, y):
+    """The visible part of the page with a sticky header and a scrollbar"""
+    frame = page[y:y + FRAME_HEIGHT].copy()
+    frame[:HEADER] = (40, 40, 120)
+    frame[:, -12:] = 230
+    thumb = y * (FRAME_HEIGHT - 40) // (len(page) - FRAME_HEIGHT)
+    frame[thumb:thumb + 40, -12:] = 120
+    return frame
+
+def ocr_array(ocr, config, tmp, rows):
+    path = os.path.join(tmp, "region.png")
+    Image.fromarray(rows).save(path)
+    try:
+        return ocr.ocr_image(path, config, {}, {})
+    finally:
+        for side in os.listdir(tmp):
+            if side.startswith("region.png"):
+                os.remove(os.path.join(tmp, side))
+
+def accuracy(text):
+    return sum(1 for line in LINES if line in text) / len(LINES)
+
+def main():
+    ocr = load_script()
+    page = render_page()
+    frames = [frame_at(page, y) for y in range(0, len(page) - FRAME_HEIGHT + 1, 160)]
+    with tempfile.TemporaryDirectory() as tmp:
+        ocr.STATS_PATH = os.path.join(tmp, "stats.json")
+        config = dict(ocr.DEFAULT_CONFIG, speculative_raw=False, line_cache=False,
+                      post_correction=False)
+        ocr.configure_threads(config)
+
+        start = time.perf_counter()
+        texts = [ocr_array(ocr, config, tmp, frame) for frame in frames]
+        elapsed = time.perf_counter() - start
+        print(f"full frames: {len(frames)} frames, {len(frames) * FRAME_HEIGHT} rows OCR'd "
+              f"in {elapsed:.2f}s, accuracy {accuracy(' '.join(texts)):.0%} (duplicated)")
+
+        start = time.perf_counter()
+        stitcher = ocr.ScrollStitcher()
+        strips = [stitcher.add(frame)[0] for frame in frames] + [stitcher.finish()]
+        stitching = time.perf_counter() - start
+        texts = [ocr_array(ocr, config, tmp, strip) for strip in strips if strip is not None]
+        elapsed = time.perf_counter() - start
+        print(f"   stitched: {len(texts)} strips, {stitcher.rows} rows OCR'd in {elapsed:.2f}s "
+              f"({stitching * 1000 / len(frames):.1f} ms/frame matching), "
+              f"accuracy {accuracy(' '.join(texts)):.0%}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+#!/usr/bin/python3
+"""
+Load-test the OCR service: send captures from several concurrent clients
+and report throughput, tail latency, 429 rejections and batching.
+Starts its own service on a temporary socket unless --socket is given.
+"""
+
+import argparse
+import http.client
+import io
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from PIL import Image, ImageDraw
+from benchmark_common import SCRIPT
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path):
+        super().__init__("localhost")
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.path)
+
+def create_capture(index, large):
+    """A one-line label, or a screenful of text for the large ones"""
+    size, lines = ((1400, 900), 40) if large else ((360, 40), 1)
+    img = Image.new('RGB', size, 'white')
+    draw = ImageDraw.Draw(img)
+    for line in range(lines):
+        draw.text((8, 12 + line * 21), f"Request {index} line {line}: status ok in 12 ms",
+                  fill="black")
+    buf = io.BytesIO()
+    img.save(buf, "PNG")
+    return buf.getvalue()
+
+def request(path, method, url, body=None):
+    conn = UnixHTTPConnection(path)
+    try:
+        conn.request(method, url, body=body, headers={"Content-Type": "image/png"})
+        response = conn.getresponse()
+        return response.status, json.loads(response.read() or b"{}")
+    finally:
+        conn.close()
+
+def wait_for_socket(path, proc, timeout=10):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            sys.exit(f"Service exited with {proc.returncode}")
+        try:
+            request(path, "GET", "/status")
+            return
+        except OSError:
+            time.sleep(0.1)
+    sys.exit("Service did not start")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--socket", help="Use a running service on this socket")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--large-every", type=int, default=10,
+                        help="Every Nth request is a full-screen capture (0 = none)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.socket or os.path.join(tmp, "service.sock")
+        proc = None
+        if not args.socket:
+            proc = subprocess.Popen([sys.executable, SCRIPT, "serve", "--socket", path],
+                                    stdout=subprocess.DEVNULL)
+            wait_for_socket(path, proc)
+        try:
+            bodies = [create_capture(i, args.large_every and i % args.large_every == 0)
+                      for i in range(min(args.requests, 50))]
+            latencies = []
+            codes = {}
+            lock = threading.Lock()
+            counter = iter(range(args.requests))
+
+            def client():
+                for i in counter:
+                    start = time.perf_counter()
+                    try:
+                        status, _ = request(path, "POST", "/ocr", bodies[i % len(bodies)])
+                    except OSError:
+                        status = "error"
+                    elapsed = time.perf_counter() - start
+                    with lock:
+                        codes[status] = codes.get(status, 0) + 1
+                        if status == 200:
+                            latencies.append(elapsed)
+
+            start = time.perf_counter()
+            threads = [threading.Thread(target=client) for _ in range(args.concurrency)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - start
+
+            latencies.sort()
+            def percentile(p):
+                return latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000
+            print(f"{args.requests} requests, {args.concurrency} clients in {elapsed:.2f}s: "
+                  f"{len(latencies) / elapsed:.1f} OCR results/s, responses {codes}")
+            if latencies:
+                print(f"latency p50 {percentile(0.5):.0f} ms, p95 {percentile(0.95):.0f} ms, "
+                      f"p99 {percentile(0.99):.0f} ms, max {latencies[-1] * 1000:.0f} ms")
+            print(f"service: {request(path, 'GET', '/status')[1]}")
+        finally:
+            if proc:
+                proc.terminate()
+                proc.wait()
+
+if __name__ == "__main__":
+    main()
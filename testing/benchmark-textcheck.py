@@ -0,0 +1,86 @@
+#!/usr/bin/python3
+"""
+Measure the no-text pre-check: false-negative rate on text captures,
+true-negative rate on non-text captures, and per-image latency
+"""
+
+import os
+import random
+import tempfile
+import time
+import numpy as np
+from PIL import Image, ImageDraw, ImageFilter
+from benchmark_common import load_font, load_script
+
+LINES = [
+    "Medium paragraph text with numbers 12345",
+    "def handler(request): return render(request)",
+    "File  Edit  View  Search  Terminal  Help",
+    "ERROR: connection refused (errno 111)",
+    "Mixed Case: Hello World 2024!",
+]
+
+def text_sample(rng):
+    """A text capture: random size, theme, font and line count"""
+    w, h = rng.choice([(300, 40), (640, 200), (1200, 700), (2400, 1400)])
+    dark = rng.random() < 0.4
+    bg = tuple(rng.randint(0, 60) for _ in range(3)) if dark else \
+        tuple(rng.randint(200, 255) for _ in range(3))
+    fg = tuple(rng.randint(170, 255) for _ in range(3)) if dark else \
+        tuple(rng.randint(0, 90) for _ in range(3))
+    img = Image.new('RGB', (w, h), bg)
+    draw = ImageDraw.Draw(img)
+    size = rng.choice([11, 13, 16, 22, 30])
+    f = load_font(size, "DejaVuSansMono.ttf" if rng.random() < 0.5 else "DejaVuSans.ttf")
+    y = 6
+    for _ in range(rng.randint(1, 30)):
+        if y + size > h:
+            break
+        draw.text((8, y), rng.choice(LINES), fill=fg, font=f)
+        y += int(size * 1.5)
+    return img
+
+def non_text_sample(rng):
+    """Blank areas, gradients and photo-like images"""
+    w, h = rng.choice([(300, 200), (800, 600), (1920, 1080)])
+    kind = rng.choice(["blank", "gradient", "photo"])
+    if kind == "blank":
+        return Image.new('RGB', (w, h), tuple(rng.randint(0, 255) for _ in range(3)))
+    if kind == "gradient":
+        ramp = np.linspace(rng.randint(0, 120), rng.randint(130, 255), w)
+        return Image.fromarray(np.tile(ramp, (h, 1)).astype(np.uint8)).convert('RGB')
+    # Photo-like: blurred noise plus soft shapes
+    noise = np.random.default_rng(rng.randint(0, 1 << 30)).integers(0, 255, (h // 8, w // 8, 3))
+    img = Image.fromarray(noise.astype(np.uint8)).resize((w, h), Image.BICUBIC)
+    draw = ImageDraw.Draw(img)
+    for _ in range(12):
+        x, y = rng.randint(0, w), rng.randint(0, h)
+        r = rng.randint(20, 200)
+        draw.ellipse([x - r, y - r, x + r, y + r], fill=tuple(rng.randint(0, 255) for _ in range(3)))
+    return img.filter(ImageFilter.GaussianBlur(3))
+
+def main():
+    ocr = load_script()
+    rng = random.Random(7)
+    results = {"text": [], "non-text": []}
+    latency = []
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "sample.png")
+        for label, make in (("text", text_sample), ("non-text", non_text_sample)):
+            for _ in range(100):
+                make(rng).save(path)
+                start = time.perf_counter()
+                maybe_text, _ = ocr.detect_text_presence(path)
+                latency.append(time.perf_counter() - start)
+                results[label].append(maybe_text)
+
+    false_negatives = results["text"].count(False)
+    skipped = results["non-text"].count(False)
+    print(f"False negatives: {false_negatives}/{len(results['text'])} text captures skipped")
+    print(f"Skipped OCR on {skipped}/{len(results['non-text'])} non-text captures")
+    print(f"Latency: median {sorted(latency)[len(latency) // 2] * 1000:.1f} ms, "
+          f"max {max(latency) * 1000:.1f} ms (includes PNG decode)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Shared by the benchmarks: load xclip-ocr.py (or another script of the
+repository) as a module, DejaVu fonts with a fallback, and the
+enhance-then-OCR loop of the preprocessing comparisons
+"""
+
+import importlib.util
+import os
+import shutil
+import time
+from PIL import ImageFont
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+SCRIPT = os.path.join(ROOT, "xclip-ocr.py")
+FONT_DIR = "/usr/share/fonts/truetype/dejavu"
+
+def load_script(name="xclip_ocr", filename="xclip-ocr.py"):
+    spec = importlib.util.spec_from_file_location(name, os.path.join(ROOT, filename))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def load_font(size=16, name="DejaVuSans.ttf"):
+    try:
+        return ImageFont.truetype(os.path.join(FONT_DIR, name), size)
+    except OSError:
+        return ImageFont.load_default()
+
+def stage_config(ocr, **settings):
+    """
+    DEFAULT_CONFIG plus settings, with speculation, the cascade, the line
+    cache and post-correction off so only the stage under test varies
+    """
+    config = dict(ocr.DEFAULT_CONFIG, speculative_raw=False, model_cascade=False,
+                  line_cache=False, post_correction=False)
+    config.update(settings)
+    return config
+
+def word_accuracy(expected, text):
+    words = expected.split()
+    return sum(1 for word in words if word in text) / len(words)
+
+def run_corpus(ocr, corpus, config, work_dir):
+    """
+    Enhance and OCR a copy of each (path, expected) sample; returns one
+    dict per sample with the text, stats, timings and word accuracy
+    """
+    ocr.configure_threads(config)
+    results = []
+    for path, expected in corpus:
+        work_path = os.path.join(work_dir, "work.png")
+        shutil.copy(path, work_path)
+        stats = {}
+        start = time.perf_counter()
+        ocr.enhance_image_for_ocr(work_path, config)
+        preprocess = time.perf_counter() - start
+        text = ocr.run_ocr_with_best_settings(work_path, stats, config)
+        results.append({"path": path, "text": text, "stats": stats, "preprocess": preprocess,
+                        "total": time.perf_counter() - start,
+                        "accuracy": word_accuracy(expected, text)})
+    return results
@@ -2,8 +2,31 @@
 
 import subprocess
 import os
+import sys
+import argparse
+import json
+import fcntl
+import socket
+import threading
 import tempfile
 import traceback
+import time
+import hashlib
+import queue
+import sqlite3
+import resource
+import re
+import shutil
+import glob
+import html
+import io
+import difflib
+import socketserver
+from collections import Counter, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import numpy as np
 from PIL import Image, ImageFilter, ImageEnhance
 
 DEBUG_LOG = "/tmp/xclip-ocr-debug.txt"
@@ -13,153 +36,3546 @@ ERROR_LOG = "/tmp/xclip-ocr-error.log"
 ENV = os.environ.copy()
 ENV["TESSDATA_PREFIX"] = "/usr/share/tesseract-ocr/5/tessdata/"
 
+# User configuration (JSON), merged over the tuned profile and DEFAULT_CONFIG
+CONFIG_PATH = os.path.expanduser("~/.config/xclip-ocr/config.json")
+# Machine-tuned settings written by `install.py --calibrate`
+PROFILE_PATH = os.path.expanduser("~/.config/xclip-ocr/profile.json")
+DEFAULT_CONFIG = {
+    # What a new hotkey press does while a previous run is still busy:
+    # "cancel" the old run, "queue" behind it, or "attach" to its result
+    "overlap_policy": "cancel",
+    # OCR history database; retention is bounded by entry count and text size
+    "history_enabled": True,
+    "history_max_entries": 5000,
+    "history_max_bytes": 20 * 1024 * 1024,
+    # Captures with at least this many pixels are preprocessed in strips
+    # on a single uint8 buffer; the RSS cap applies to that mode
+    "bounded_min_pixels": 8_000_000,
+    "bounded_strip_height": 256,
+    "max_preprocess_rss_mb": 768,
+    # Invert dark-background regions so Tesseract sees dark-on-light text
+    "polarity_fix": True,
+    "polarity_tile": 48,
+    # Colour captures: per tile, pick the grey projection (luma, a single
+    # channel, max or min channel) that best separates text
+    # from the background instead of always converting to luma
+    "channel_selection": True,
+    "channel_tile": 32,
+    # Context-aware fixes for l/1/I, O/0 and rn/m confusions
+    "post_correction": True,
+    "dictionary_words": "/usr/share/dict/words",
+    # Tesseract threading: OMP threads per process (0 = Tesseract default),
+    # configs run in parallel, and the total threads all processes may use
+    # (0 = CPU count)
+    "omp_thread_limit": 0,
+    "ocr_workers": 1,
+    "thread_budget": 0,
+    # Page segmentation modes, tried in order
+    "ocr_psm_order": [6, 11, 7, 3],
+    # Captures narrower or shorter than this are upscaled before OCR
+    "upscale_min_width": 400,
+    "upscale_min_height": 200,
+    # Erase long thin horizontal/vertical strokes (table grids, borders,
+    # separators) at least this many pixels long and at most this wide
+    "ruling_removal": True,
+    "ruling_min_length": 40,
+    "ruling_max_width": 4,
+    # Local adaptive binarization ("sauvola" or "wolf") in place of the
+    # median/contrast/sharpen chain; "none" keeps the grayscale chain
+    "binarization": "none",
+    "binarize_window": 31,
+    "binarize_k": 0.2,
+    # Skip OCR when a thumbnail check is confident the capture has no text
+    "text_precheck": True,
+    # Content mode: "auto" picks one from the active window title using
+    # content_mode_rules (first match wins), otherwise "text"
+    "content_mode": "auto",
+    "content_mode_rules": {
+        "code": ["visual studio code", "vim", "emacs", "pycharm", "intellij",
+                 "sublime", "terminal", "konsole", "alacritty", "kitty", "tmux"],
+        "numbers": ["calculator", "libreoffice calc", "gnumeric"],
+    },
+    # Model cascade: OCR with the fast model on a lightly preprocessed image,
+    # then re-read only lines below the confidence threshold with the best
+    # model on the fully preprocessed image. Needs both tessdata directories.
+    "model_cascade": True,
+    "tessdata_fast": "/usr/share/tesseract-ocr/5/tessdata/",
+    "tessdata_best": "/usr/share/tesseract-ocr/5/tessdata_best/",
+    "cascade_min_confidence": 70,
+    # Speculative OCR of the raw capture while preprocessing runs; the raw
+    # result wins if its confidence clears the threshold. Per app, it is
+    # switched off once it has lost too often, and re-tried every
+    # speculative_retry_every captures while off (0 = never).
+    "speculative_raw": True,
+    "speculative_min_confidence": 80,
+    "speculative_min_win_rate": 0.2,
+    "speculative_min_samples": 20,
+    "speculative_retry_every": 20,
+    # Recognised text per segmented line image, reused when the same line
+    # shows up in a later capture (recaptures, scrolling); LRU-evicted
+    "line_cache": True,
+    "line_cache_max_entries": 50000,
+    # Scroll capture: the selected region is grabbed this often (seconds)
+    # while the user scrolls, until nothing new has appeared for the idle
+    # timeout or the frame limit is reached
+    "scroll_interval": 0.25,
+    "scroll_idle_timeout": 2.0,
+    "scroll_max_frames": 400,
+    # What goes on the clipboard ("text", "html" or "json") and which files
+    # ("txt", "tsv", "hocr", "json") are written to output_dir per capture
+    "clipboard_format": "text",
+    "save_formats": [],
+    "output_dir": "~/.local/share/xclip-ocr/output",
+    # Flight recorder: keep the last captures (images, per-config outputs,
+    # timings, result) for `xclip-ocr.py replay`, bounded by count and size
+    "flight_recorder": False,
+    "flight_recorder_max_captures": 20,
+    "flight_recorder_max_mb": 200,
+    # Background QoS class (document batches): niceness, and the share of
+    # cores it may use. Background work also gets idle CPU and I/O
+    # scheduling and waits while an interactive capture is running.
+    "qos_background_nice": 15,
+    "qos_background_core_share": 0.5,
+    # Power profile: "auto" follows the power supply state, "ac" always runs
+    # the full-accuracy pipeline and "battery" always the low-energy one
+    # (first PSM only, fast model, no cascade or speculation, capped threads)
+    "power_profile": "auto",
+    "power_supply_path": "/sys/class/power_supply",
+    "battery_thread_limit": 1,
+    # Capture backend: "flameshot", or "x11" for an in-process grab with a
+    # rubber-band selector (needs python-xlib). A fixed region (WxH+X+Y, or
+    # "last" for the last selected one) skips the selection.
+    "capture_backend": "flameshot",
+    "capture_region": None,
+    # OCR service (`xclip-ocr.py serve`): concurrent jobs (0 = one per
+    # core), queued requests beyond which clients get 429, and batching of
+    # small images (up to this many pixels each) into one stacked pass
+    "serve_workers": 0,
+    "serve_queue_size": 32,
+    "serve_max_mb": 20,
+    "serve_batch_size": 8,
+    "serve_batch_max_pixels": 250_000,
+    "serve_batch_wait_ms": 20,
+}
+
+URL_CHARS = ("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789"
+             "-._~:/?#[]@!$&'()*+,;=%")
+
+# Extra Tesseract parameters per content mode. Narrower character sets and
+# disabled word lists shrink the search space; skipping the dictionary
+# DAWGs also shortens model load.
+CONTENT_MODES = {
+    "text": {
+        "params": [],
+    },
+    "code": {
+        "params": ["-c", "load_system_dawg=0", "-c", "load_freq_dawg=0",
+                   "-c", "preserve_interword_spaces=1"],
+        "post_correction": False,
+    },
+    "numbers": {
+        "params": ["-c", "tessedit_char_whitelist=0123456789.,:;+-%$€£/() "],
+        "psm_order": [6, 7, 11],
+    },
+    "url": {
+        "params": ["-c", "load_system_dawg=0", "-c", "load_freq_dawg=0",
+                   "-c", f"tessedit_char_whitelist={URL_CHARS}"],
+        "psm_order": [7, 6, 11],
+        "post_correction": False,
+    },
+}
+
+HISTORY_DB = os.path.expanduser("~/.local/share/xclip-ocr/history.db")
+# Cumulative pipeline counters (cascade escalations and the like)
+STATS_PATH = os.path.expanduser("~/.local/share/xclip-ocr/stats.json")
+DICTIONARY_DB = os.path.expanduser("~/.cache/xclip-ocr/dictionary.db")
+LINE_CACHE_DB = os.path.expanduser("~/.cache/xclip-ocr/lines.db")
+RECORDER_DIR = os.path.expanduser("~/.local/share/xclip-ocr/recorder")
+
+# Per-user single-instance lock and control socket
+RUNTIME_DIR = os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir()
+LOCK_PATH = os.path.join(RUNTIME_DIR, f"xclip-ocr-{os.getuid()}.lock")
+CONTROL_SOCKET = os.path.join(RUNTIME_DIR, f"xclip-ocr-{os.getuid()}.sock")
+# Geometry of the last region selected or captured, for capture_region "last"
+LAST_REGION_PATH = os.path.expanduser("~/.cache/xclip-ocr/last-region")
+# Default endpoint of the OCR service
+SERVICE_SOCKET = os.path.join(RUNTIME_DIR, f"xclip-ocr-{os.getuid()}.service.sock")
+# Held exclusively by interactive runs; background work pauses while it is
+QOS_LOCK_PATH = os.path.join(RUNTIME_DIR, f"xclip-ocr-{os.getuid()}.qos")
+
+# State shared with the control socket thread
+ACTIVE_PROCS = set()
+ACTIVE_PROCS_LOCK = threading.Lock()
+CANCEL_EVENT = threading.Event()
+RESULT_EVENT = threading.Event()
+RUN_RESULT = {"text": ""}
+
+# QoS class of this process and its queue metrics
+QOS_CLASSES = ("interactive", "background")
+QOS_CLASS = "interactive"
+QOS_LOCK_FILE = None
+QOS_METRICS = Counter()
+QOS_METRICS_LOCK = threading.Lock()
+# Serialises stats.json updates between threads; processes use flock
+STATS_LOCK = threading.Lock()
+
+# Power profile this process runs with and the settings it changed
+POWER_PROFILE = {"profile": "ac", "changes": []}
+
 def log_debug(msg):
     with open(DEBUG_LOG, "a") as f:
         f.write(msg + "\n")
 
-def log_error(e):
-    with open(ERROR_LOG, "w") as f:
-        traceback.print_exc(file=f)
+def log_error(e):
+    with open(ERROR_LOG, "w") as f:
+        traceback.print_exc(file=f)
+
+def load_config():
+    """
+    Load the user config over the tuned profile, falling back to defaults
+    for missing keys
+    """
+    config = dict(DEFAULT_CONFIG)
+    for path in (PROFILE_PATH, CONFIG_PATH):
+        try:
+            with open(path) as f:
+                config.update(json.load(f))
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            log_debug(f"Could not read config {path}: {e}")
+    return config
+
+class ThreadBudget:
+    """
+    Counting budget of CPU threads shared by every Tesseract process we start
+    """
+
+    def __init__(self, total):
+        self.total = max(1, total)
+        self.available = self.total
+        self.cond = threading.Condition()
+
+    def acquire(self, threads, stopped=None):
+        """
+        Take threads from the budget; returns how many were taken, or 0 when
+        the optional stopped() check turns true while waiting
+        """
+        threads = min(threads, self.total)
+        with self.cond:
+            while self.available < threads:
+                if stopped and stopped():
+                    return 0
+                # Cancellation is an Event, not a notify: re-check regularly
+                self.cond.wait(0.05)
+            self.available -= threads
+        return threads
+
+    def release(self, threads):
+        with self.cond:
+            self.available += threads
+            self.cond.notify_all()
+
+THREAD_BUDGET = ThreadBudget(os.cpu_count() or 1)
+
+def configure_threads(config):
+    global THREAD_BUDGET
+    THREAD_BUDGET = ThreadBudget(config["thread_budget"] or os.cpu_count() or 1)
+    if config["omp_thread_limit"]:
+        ENV["OMP_THREAD_LIMIT"] = str(config["omp_thread_limit"])
+
+def run_tesseract(cmd, timeout, group=None, stop=None):
+    """
+    Run a Tesseract command as a tracked child so it can be cancelled.
+    The process is also added to group (a set) while it runs, so a caller
+    can kill only its own runs. Blocks until the thread budget has room
+    for its OMP threads; if the run is cancelled or stop (an event or a
+    tuple of events) is set by then, Tesseract is not started and the
+    result is empty.
+    """
+    stops = stop if isinstance(stop, tuple) else (stop,)
+
+    def stopped():
+        return CANCEL_EVENT.is_set() or any(event and event.is_set() for event in stops)
+
+    if QOS_CLASS == "background":
+        wait_for_interactive()
+    threads = THREAD_BUDGET.acquire(int(ENV.get("OMP_THREAD_LIMIT", 0)) or THREAD_BUDGET.total,
+                                    stopped)
+    try:
+        if not threads or stopped():
+            log_debug(f"Skipped stopped Tesseract run: {' '.join(cmd[1:5])}")
+            return subprocess.CompletedProcess(cmd, -1, "", "")
+        proc = subprocess.Popen(
+            cmd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            env=ENV
+        )
+        with ACTIVE_PROCS_LOCK:
+            ACTIVE_PROCS.add(proc)
+            if group is not None:
+                group.add(proc)
+        # A kill that came between the check above and the tracking
+        if stopped():
+            proc.kill()
+        try:
+            stdout, stderr = proc.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.communicate()
+            raise
+        finally:
+            with ACTIVE_PROCS_LOCK:
+                ACTIVE_PROCS.discard(proc)
+                if group is not None:
+                    group.discard(proc)
+    finally:
+        THREAD_BUDGET.release(threads)
+    return subprocess.CompletedProcess(cmd, proc.returncode, stdout, stderr)
+
+def enter_qos_class(qos, config):
+    """
+    Put this process in a QoS class; returns the config to run with.
+    Priorities are set on the calling thread, so call this before any
+    worker threads or Tesseract processes are started: both inherit them.
+    """
+    global QOS_CLASS, QOS_LOCK_FILE
+    QOS_CLASS = qos
+    if qos == "interactive":
+        # Released when the process exits
+        QOS_LOCK_FILE = open(QOS_LOCK_PATH, "a")
+        fcntl.flock(QOS_LOCK_FILE, fcntl.LOCK_EX)
+        return config
+
+    os.setpriority(os.PRIO_PROCESS, 0, config["qos_background_nice"])
+    try:
+        # Idle scheduling: any runnable normal task preempts Tesseract
+        os.sched_setscheduler(0, os.SCHED_IDLE, os.sched_param(0))
+    except (AttributeError, OSError) as e:
+        log_debug(f"SCHED_IDLE unavailable: {e}")
+    try:
+        subprocess.run(["ionice", "-c", "3", "-p", str(threading.get_native_id())],
+                       check=True, capture_output=True)
+    except (OSError, subprocess.CalledProcessError) as e:
+        log_debug(f"ionice unavailable: {e}")
+
+    cores = sorted(os.sched_getaffinity(0))
+    share = max(1, int(len(cores) * config["qos_background_core_share"]))
+    # Leave the first cores free; interactive runs start there
+    os.sched_setaffinity(0, cores[-share:])
+    log_debug(f"Background QoS: nice {config['qos_background_nice']}, "
+              f"cores {cores[-share:]}")
+    budget = min(config["thread_budget"] or share, share)
+    return dict(config, thread_budget=budget)
+
+def wait_for_interactive():
+    """
+    Throttle background work: block while an interactive run holds the QoS lock
+    """
+    start = time.perf_counter()
+    with open(QOS_LOCK_PATH, "a") as probe:
+        while not CANCEL_EVENT.is_set():
+            try:
+                fcntl.flock(probe, fcntl.LOCK_SH | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                time.sleep(0.05)
+    waited = time.perf_counter() - start
+    if waited > 0.05:
+        log_debug(f"Background work throttled for {waited:.2f}s")
+        record_qos_metrics(throttled_ms=waited * 1000, throttles=1)
+
+def record_qos_metrics(**counters):
+    with QOS_METRICS_LOCK:
+        QOS_METRICS.update(counters)
+
+def flush_qos_metrics():
+    """
+    Add this process's queue metrics to the cumulative stats, per QoS class
+    """
+    with QOS_METRICS_LOCK:
+        metrics = dict(QOS_METRICS)
+        QOS_METRICS.clear()
+    if metrics:
+        record_stats(**{f"qos_{name}:{QOS_CLASS}": value for name, value in metrics.items()})
+    return metrics
+
+def read_sysfs(path, name):
+    try:
+        with open(os.path.join(path, name)) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+def on_battery(path):
+    """
+    True when running from a discharging battery with no adapter online;
+    machines without a battery (or without sysfs) count as on AC
+    """
+    adapters = []
+    batteries = []
+    for supply in glob.glob(os.path.join(glob.escape(path), "*")):
+        kind = read_sysfs(supply, "type")
+        if kind in ("Mains", "USB"):
+            adapters.append(read_sysfs(supply, "online") == "1")
+        elif kind == "Battery" and read_sysfs(supply, "scope") != "Device":
+            # Device scope: mouse or headset batteries, not the machine's
+            batteries.append(read_sysfs(supply, "status"))
+    if any(adapters) or not batteries:
+        return False
+    return "Discharging" in batteries or bool(adapters)
+
+def apply_power_profile(config):
+    """
+    Config for the current power state. On battery: one PSM, the fast model
+    only, no speculative or cascade passes and capped Tesseract threads.
+    The profile and what it changed are kept in POWER_PROFILE for the logs.
+    """
+    profile = config["power_profile"]
+    if profile == "auto":
+        profile = "battery" if on_battery(config["power_supply_path"]) else "ac"
+    POWER_PROFILE["profile"] = profile
+    if profile != "battery":
+        return config
+
+    threads = config["battery_thread_limit"]
+    battery = {
+        "ocr_psm_order": config["ocr_psm_order"][:1],
+        "model_cascade": False,
+        "speculative_raw": False,
+        "ocr_workers": 1,
+        "omp_thread_limit": threads,
+        "thread_budget": min(config["thread_budget"] or threads, threads),
+    }
+    changes = [key for key, value in battery.items() if config[key] != value]
+    if os.path.isdir(config["tessdata_fast"]) and \
+            ENV["TESSDATA_PREFIX"].rstrip("/") != config["tessdata_fast"].rstrip("/"):
+        ENV["TESSDATA_PREFIX"] = config["tessdata_fast"]
+        changes.append("tessdata_fast")
+    POWER_PROFILE["changes"] = changes
+    log_debug(f"Power: battery profile, changed {', '.join(changes) or 'nothing'}")
+    return dict(config, **battery)
+
+def describe_power_profile():
+    changes = POWER_PROFILE["changes"]
+    return POWER_PROFILE["profile"] + (f" ({', '.join(changes)})" if changes else "")
+
+def kill_active_tesseract(group=None):
+    """
+    Kill the running Tesseract processes of a group from run_tesseract,
+    or all of them
+    """
+    with ACTIVE_PROCS_LOCK:
+        procs = list(ACTIVE_PROCS if group is None else group)
+    for proc in procs:
+        try:
+            proc.kill()
+        except OSError:
+            pass
+    return len(procs)
+
+def acquire_instance_lock(blocking=False):
+    """
+    Take the per-user lock; returns the open lock file, or None if busy
+    """
+    lock_file = open(LOCK_PATH, "w")
+    flags = fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB
+    try:
+        fcntl.flock(lock_file, flags)
+    except BlockingIOError:
+        lock_file.close()
+        return None
+    lock_file.write(str(os.getpid()))
+    lock_file.flush()
+    return lock_file
+
+def release_instance_lock(lock_file):
+    if os.path.exists(CONTROL_SOCKET):
+        os.remove(CONTROL_SOCKET)
+    fcntl.flock(lock_file, fcntl.LOCK_UN)
+    lock_file.close()
+
+def handle_control_connection(conn):
+    with conn:
+        command = conn.makefile("r").readline().strip()
+        if command == "cancel":
+            CANCEL_EVENT.set()
+            killed = kill_active_tesseract()
+            log_debug(f"Cancelled by newer invocation, killed {killed} tesseract process(es)")
+            conn.sendall(b"ok\n")
+        elif command == "attach":
+            RESULT_EVENT.wait()
+            conn.sendall(RUN_RESULT["text"].encode("utf-8"))
+        else:
+            conn.sendall(b"unknown command\n")
+
+def start_control_server():
+    """
+    Listen on the control socket so later invocations can cancel or attach
+    """
+    # Only the lock holder binds the socket, so any existing file is stale
+    if os.path.exists(CONTROL_SOCKET):
+        os.remove(CONTROL_SOCKET)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(CONTROL_SOCKET)
+    os.chmod(CONTROL_SOCKET, 0o600)
+    server.listen(4)
+
+    def serve():
+        while True:
+            try:
+                conn, _ = server.accept()
+            except OSError:
+                return
+            threading.Thread(
+                target=handle_control_connection, args=(conn,), daemon=True
+            ).start()
+
+    threading.Thread(target=serve, daemon=True).start()
+    return server
+
+def send_control_command(command, timeout=None):
+    """
+    Send a command to the running instance and return its reply
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.settimeout(timeout)
+        client.connect(CONTROL_SOCKET)
+        client.sendall(command.encode("utf-8") + b"\n")
+        chunks = []
+        while True:
+            chunk = client.recv(65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    return b"".join(chunks).decode("utf-8")
+
+def coordinate_with_running_instance(policy):
+    """
+    Apply the overlap policy against a running instance.
+    Returns (lock_file, attached_text); lock_file is None when attached.
+    """
+    lock_file = acquire_instance_lock()
+    if lock_file:
+        return lock_file, None
+
+    log_debug(f"Another run is in progress, overlap policy: {policy}")
+    try:
+        if policy == "attach":
+            return None, send_control_command("attach")
+        if policy == "cancel":
+            send_control_command("cancel", timeout=5)
+    except OSError as e:
+        log_debug(f"Control socket unavailable ({e}), queueing instead")
+
+    return acquire_instance_lock(blocking=True), None
+
+def record_stats(**counters):
+    """
+    Add to the cumulative counters in STATS_PATH. Returns the new totals;
+    a failed update is logged and never raised, since stats must not fail OCR.
+    """
+    totals = {}
+    try:
+        os.makedirs(os.path.dirname(STATS_PATH), exist_ok=True)
+        with STATS_LOCK, open(STATS_PATH + ".lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                with open(STATS_PATH) as f:
+                    totals = json.load(f)
+            except (FileNotFoundError, ValueError):
+                pass
+            for name, value in counters.items():
+                totals[name] = totals.get(name, 0) + value
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(STATS_PATH), suffix=".tmp")
+            try:
+                with os.fdopen(fd, "w") as f:
+                    json.dump(totals, f, indent=2)
+                os.replace(tmp_path, STATS_PATH)
+            except BaseException:
+                os.remove(tmp_path)
+                raise
+    except Exception as e:
+        log_debug(f"Could not update {STATS_PATH}: {e}")
+        for name, value in counters.items():
+            totals.setdefault(name, value)
+    return totals
+
+def get_active_window_name():
+    try:
+        result = subprocess.run(
+            ["xdotool", "getactivewindow", "getwindowname"],
+            capture_output=True,
+            text=True,
+            env=ENV,
+            timeout=1
+        )
+        return result.stdout.strip()
+    except Exception:
+        return ""
+
+def hash_file(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+def open_history_db(path=HISTORY_DB):
+    """
+    Open the history database, creating the schema and FTS5 index on first use
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    db = sqlite3.connect(path)
+    db.executescript("""
+        CREATE TABLE IF NOT EXISTS history (
+            id INTEGER PRIMARY KEY,
+            timestamp REAL NOT NULL,
+            window TEXT,
+            image_hash TEXT,
+            config TEXT,
+            confidence REAL,
+            timings TEXT,
+            text TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS history_image_hash ON history(image_hash);
+    """)
+    try:
+        db.executescript("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS history_fts USING fts5(
+                text, window, content='history', content_rowid='id'
+            );
+            CREATE TRIGGER IF NOT EXISTS history_ai AFTER INSERT ON history BEGIN
+                INSERT INTO history_fts(rowid, text, window)
+                VALUES (new.id, new.text, new.window);
+            END;
+            CREATE TRIGGER IF NOT EXISTS history_ad AFTER DELETE ON history BEGIN
+                INSERT INTO history_fts(history_fts, rowid, text, window)
+                VALUES ('delete', old.id, old.text, old.window);
+            END;
+        """)
+    except sqlite3.OperationalError as e:
+        # SQLite built without FTS5; search falls back to LIKE
+        log_debug(f"FTS5 unavailable: {e}")
+    return db
+
+def has_fts(db):
+    row = db.execute(
+        "SELECT 1 FROM sqlite_master WHERE name = 'history_fts'"
+    ).fetchone()
+    return row is not None
+
+def prune_history(db, max_entries, max_bytes):
+    """
+    Drop the oldest entries beyond the count and text-size limits
+    """
+    db.execute(
+        "DELETE FROM history WHERE id NOT IN "
+        "(SELECT id FROM history ORDER BY id DESC LIMIT ?)",
+        (max_entries,)
+    )
+    db.execute(
+        "DELETE FROM history WHERE id IN (SELECT id FROM ("
+        "SELECT id, SUM(LENGTH(CAST(text AS BLOB))) OVER (ORDER BY id DESC) AS total "
+        "FROM history) WHERE total > ?)",
+        (max_bytes,)
+    )
+
+class HistoryWriter:
+    """
+    Background writer that batches history entries into single transactions
+    so the capture path never waits on disk I/O
+    """
+
+    def __init__(self, config, path=HISTORY_DB):
+        self.config = config
+        self.path = path
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def add(self, entry):
+        self.queue.put(entry)
+
+    def close(self, timeout=5):
+        self.queue.put(None)
+        self.thread.join(timeout)
+
+    def _run(self):
+        db = None
+        done = False
+        while not done:
+            batch = [self.queue.get()]
+            while True:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            if None in batch:
+                done = True
+                batch = [entry for entry in batch if entry is not None]
+            if not batch:
+                continue
+            try:
+                if db is None:
+                    db = open_history_db(self.path)
+                with db:
+                    db.executemany(
+                        "INSERT INTO history (timestamp, window, image_hash, config, "
+                        "confidence, timings, text) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        [(e["timestamp"], e.get("window"), e.get("image_hash"),
+                          e.get("config"), e.get("confidence"),
+                          json.dumps(e.get("timings", {})), e["text"])
+                         for e in batch]
+                    )
+                    prune_history(db, self.config["history_max_entries"],
+                                  self.config["history_max_bytes"])
+                log_debug(f"History: wrote {len(batch)} entr(y/ies)")
+            except Exception as e:
+                log_debug(f"History write failed: {e}")
+                log_error(e)
+        if db is not None:
+            db.close()
+
+def search_history(db, query=None, limit=20):
+    if not query:
+        sql = "SELECT id, timestamp, window, config, text FROM history ORDER BY id DESC LIMIT ?"
+        return db.execute(sql, (limit,)).fetchall()
+    if has_fts(db):
+        # Quote each term so user input is never parsed as FTS5 syntax
+        match = " ".join('"' + term.replace('"', '""') + '"' for term in query.split())
+        sql = ("SELECT h.id, h.timestamp, h.window, h.config, h.text FROM history_fts "
+               "JOIN history h ON h.id = history_fts.rowid "
+               "WHERE history_fts MATCH ? ORDER BY rank LIMIT ?")
+        return db.execute(sql, (match, limit)).fetchall()
+    sql = ("SELECT id, timestamp, window, config, text FROM history "
+           "WHERE text LIKE ? ORDER BY id DESC LIMIT ?")
+    return db.execute(sql, (f"%{query}%", limit)).fetchall()
+
+def history_command(args):
+    if not os.path.exists(HISTORY_DB):
+        print("No history recorded yet.")
+        return
+    db = open_history_db()
+    try:
+        if args.copy is not None:
+            row = db.execute("SELECT text FROM history WHERE id = ?", (args.copy,)).fetchone()
+            if row is None:
+                print(f"No history entry {args.copy}")
+                sys.exit(1)
+            copy_to_clipboard(row[0])
+            print(f"Copied entry {args.copy} ({len(row[0])} chars)")
+            return
+        for entry_id, timestamp, window, config, text in search_history(
+                db, " ".join(args.query), args.limit):
+            when = time.strftime("%Y-%m-%d %H:%M", time.localtime(timestamp))
+            preview = text.replace("\n", " ")[:80]
+            print(f"{entry_id:>6}  {when}  [{window or '?'}]  {preview}")
+    finally:
+        db.close()
+
+class FlightRecorder:
+    """
+    Ring buffer of recent captures on disk: raw and preprocessed image,
+    every config's Tesseract output, timings and the result, for `replay`
+    """
+
+    def __init__(self, config, root=RECORDER_DIR):
+        self.config = config
+        self.root = root
+        self.dir = None
+        self.raw_hash = None
+        self.record = {}
+
+    def save_raw(self, temp_path):
+        self.dir = os.path.join(self.root, time.strftime("%Y%m%d-%H%M%S") + f"-{os.getpid()}")
+        os.makedirs(self.dir, exist_ok=True)
+        self.raw_hash = hash_file(temp_path)
+        self._save_png(temp_path, "raw.png")
+        self.record["timestamp"] = time.time()
+
+    def _save_png(self, path, name):
+        # PPM captures from the x11 backend are kept as PNG like the rest
+        if path.endswith(".png"):
+            shutil.copy(path, os.path.join(self.dir, name))
+        else:
+            with Image.open(path) as img:
+                img.save(os.path.join(self.dir, name))
+
+    def finish(self, temp_path, timings, stats):
+        if not self.dir:
+            return
+        try:
+            # Preprocessing rewrites the capture in place
+            if os.path.exists(temp_path) and hash_file(temp_path) != self.raw_hash:
+                self._save_png(temp_path, "preprocessed.png")
+            for path in glob.glob(glob.escape(temp_path) + ".*"):
+                shutil.copy(path, os.path.join(self.dir, path[len(temp_path) + 1:]))
+            self.record.update(timings=timings,
+                               stats={k: v for k, v in stats.items() if k != "output_base"})
+            with open(os.path.join(self.dir, "record.json"), "w") as f:
+                json.dump(self.record, f, indent=2, default=str)
+            self.prune()
+        except OSError as e:
+            log_debug(f"Flight recorder failed: {e}")
+
+    def prune(self):
+        entries = sorted(glob.glob(os.path.join(self.root, "*", "")))
+        sizes = [sum(os.path.getsize(path) for path in glob.glob(entry + "*"))
+                 for entry in entries]
+        cap = self.config["flight_recorder_max_mb"] * 1024 * 1024
+        while entries and (len(entries) > self.config["flight_recorder_max_captures"]
+                           or sum(sizes) > cap):
+            shutil.rmtree(entries.pop(0), ignore_errors=True)
+            sizes.pop(0)
+
+def load_recording(name):
+    """
+    Recording directory and record for a name (or unique prefix, or "last")
+    """
+    entries = sorted(os.path.basename(os.path.dirname(entry))
+                     for entry in glob.glob(os.path.join(RECORDER_DIR, "*", "")))
+    matches = entries[-1:] if name == "last" else [e for e in entries if e.startswith(name)]
+    if len(matches) != 1:
+        return None, None
+    path = os.path.join(RECORDER_DIR, matches[0])
+    try:
+        with open(os.path.join(path, "record.json")) as f:
+            return path, json.load(f)
+    except (OSError, ValueError):
+        return None, None
+
+def ocr_latency(timings):
+    return sum(sec for stage, sec in timings.items() if stage != "capture")
+
+def replay_command(args, config):
+    """
+    Re-run a recorded capture through the current code and diff latency
+    and output against the recording
+    """
+    if not args.recording:
+        entries = sorted(glob.glob(os.path.join(RECORDER_DIR, "*", "")))
+        if not entries:
+            print("No recorded captures. Set flight_recorder to true in the config.")
+        for entry in entries:
+            name = os.path.basename(os.path.dirname(entry))
+            _, record = load_recording(name)
+            if record is None:
+                continue
+            status = "error" if record.get("error") else f"{len(record.get('text') or '')} chars"
+            print(f"{name}  {ocr_latency(record.get('timings', {})) * 1000:>7.0f} ms  "
+                  f"{status:>10}  [{record.get('window') or '?'}]")
+        return
+
+    path, record = load_recording(args.recording)
+    if record is None:
+        print(f"No single recording matches {args.recording}")
+        sys.exit(1)
+
+    # The recorded effective config, or today's config in the recorded mode
+    if args.current_config:
+        replay_config = apply_content_mode(config, record["mode"])
+    else:
+        replay_config = dict(DEFAULT_CONFIG, **record["config"])
+    # A warm line cache would hide the recognition cost being compared
+    replay_config["line_cache"] = False
+    for item in args.set:
+        key, _, value = item.partition("=")
+        try:
+            replay_config[key] = json.loads(value)
+        except ValueError:
+            replay_config[key] = value
+    configure_threads(replay_config)
+
+    global STATS_PATH
+    live_stats = STATS_PATH
+    with tempfile.NamedTemporaryFile(suffix=".png", delete=False) as temp_img:
+        temp_path = temp_img.name
+    timings = {}
+    stats = {}
+    try:
+        shutil.copy(os.path.join(path, "raw.png"), temp_path)
+        # Decide from a copy of the live counters, but never add to them
+        STATS_PATH = temp_path + ".stats.json"
+        if os.path.exists(live_stats):
+            shutil.copy(live_stats, STATS_PATH)
+        text = ocr_image(temp_path, replay_config, stats, timings, record.get("app", "unknown"))
+        text = finish_text(text, replay_config, timings)
+    finally:
+        STATS_PATH = live_stats
+        for out_path in glob.glob(glob.escape(temp_path) + ".*"):
+            try:
+                os.remove(out_path)
+            except FileNotFoundError:
+                # An abandoned speculative pass may remove its own copy first
+                pass
+        os.remove(temp_path)
+
+    recorded = record.get("timings", {})
+    print(f"{'stage':<12} {'recorded':>10} {'replay':>10} {'delta':>10}")
+    for stage in [s for s in recorded if s != "capture"] + [s for s in timings if s not in recorded]:
+        before, after = recorded.get(stage), timings.get(stage)
+        cells = [f"{v * 1000:.1f} ms" if v is not None else "-" for v in (before, after)]
+        delta = f"{(after - before) * 1000:+.1f} ms" if None not in (before, after) else ""
+        print(f"{stage:<12} {cells[0]:>10} {cells[1]:>10} {delta:>10}")
+    before, after = ocr_latency(recorded), ocr_latency(timings)
+    print(f"{'total':<12} {before * 1000:>7.1f} ms {after * 1000:>7.1f} ms "
+          f"{(after - before) * 1000:>+7.1f} ms")
+    print(f"config: {record.get('stats', {}).get('config')} -> {stats.get('config')}")
+
+    diff = list(difflib.unified_diff((record.get("text") or "").splitlines(),
+                                     text.splitlines(), "recorded", "replay", lineterm=""))
+    print("\n".join(diff) if diff else "Output unchanged.")
+
+# Rows of context on each side of a strip; covers the median and unsharp kernels
+STRIP_HALO = 8
+
+def reset_peak_rss():
+    """
+    Reset the kernel's peak-RSS counter so the next reading covers one stage
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+def peak_rss_mb():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def current_rss_mb():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except OSError:
+        return peak_rss_mb()
+
+class StageMemory:
+    """
+    Records the peak RSS of each preprocessing stage and checks it against a cap
+    """
+
+    def __init__(self, cap_mb):
+        self.cap_mb = cap_mb
+        self.peaks = {}
+        reset_peak_rss()
+
+    def mark(self, stage):
+        peak = peak_rss_mb()
+        self.peaks[stage] = peak
+        log_debug(f"Stage {stage}: peak RSS {peak:.1f} MB")
+        reset_peak_rss()
+        if peak > self.cap_mb:
+            raise MemoryError(f"{stage} peaked at {peak:.1f} MB, cap is {self.cap_mb} MB")
+
+def filter_in_strips(buf, strip_height, func, halo=STRIP_HALO):
+    """
+    Apply an image filter to a 2D uint8 buffer in place, one strip at a time.
+    Each strip is filtered with `halo` rows of unfiltered context on both sides.
+    """
+    h = buf.shape[0]
+    saved = None  # unfiltered rows just above the current strip
+    for y0 in range(0, h, strip_height):
+        y1 = min(y0 + strip_height, h)
+        top, bottom = max(0, y0 - halo), min(h, y1 + halo)
+        chunk = buf[top:bottom].copy()
+        if saved is not None:
+            chunk[:y0 - top] = saved
+        saved = buf[max(0, y1 - halo):y1].copy()
+        out = func(chunk)
+        buf[y0:y1] = out[y0 - top:y1 - top]
+        del chunk, out
+
+def pil_filter(image_filter):
+    return lambda chunk: np.asarray(Image.fromarray(chunk).filter(image_filter))
+
+def run_lengths(mask):
+    """
+    Label the horizontal runs of a 2D boolean mask. Returns (labels, lengths):
+    labels is 0 outside runs, lengths[label] is the length of each run.
+    """
+    h, w = mask.shape
+    padded = np.zeros((h, w + 1), dtype=bool)
+    padded[:, :w] = mask
+    flat = padded.ravel()
+    starts = flat.copy()
+    starts[1:] &= ~flat[:-1]
+    labels = np.cumsum(starts) * flat
+    return labels.reshape(h, w + 1)[:, :w], np.bincount(labels)
+
+def ruling_mask(gray, background, min_length, max_width):
+    """
+    Pixels of ruling lines. A line is an ink run at least min_length long,
+    at least 80% of whose pixels sit in perpendicular runs no wider than
+    max_width: text strokes are too short and filled areas too thick to
+    qualify. A horizontal line must also be at least four times as long
+    as the text strokes around it, so runs of underscores in large code
+    fonts are not taken for lines. Of a line, only thin pixels close to
+    the line's mean level and crossings with other lines are returned, so
+    glyphs cut by a line survive.
+    """
+    levels = gray.astype(np.int16)
+    ink = np.abs(levels - background) > 32
+    h_labels, h_lengths = run_lengths(ink)
+    v_labels, v_lengths = run_lengths(ink.T)
+    h_thin = (h_lengths[h_labels] <= max_width) & ink
+    v_run = v_lengths[v_labels].T
+    v_thin = (v_run <= max_width) & ink
+
+    def line_pixels(labels, lengths, across_thin, values, ink):
+        # Per-run statistics over ink pixels only
+        runs = labels[ink]
+        thin = np.bincount(runs, weights=across_thin[ink], minlength=len(lengths))
+        keep = (lengths >= min_length) & (thin >= 0.8 * lengths)
+        keep[0] = False
+        mean = np.bincount(runs, weights=values[ink], minlength=len(lengths))
+        mean /= np.maximum(lengths, 1)
+        line = np.zeros_like(ink)
+        line[ink] = keep[runs]
+        like = np.zeros_like(ink)
+        like[ink] = np.abs(values[ink] - mean[runs]) <= 48
+        return line, like
+
+    horizontal, h_like = line_pixels(h_labels, h_lengths, v_thin, levels, ink)
+    vertical, v_like = line_pixels(v_labels, v_lengths, h_thin.T, levels.T, ink.T)
+    vertical, v_like = vertical.T, v_like.T
+
+    # Height of the text strokes next to each horizontal line: the 90th
+    # percentile vertical run over nearby ink that is not itself a line
+    strokes = np.where(ink & ~horizontal & ~vertical, v_run, 0)
+    ys, xs = np.nonzero(horizontal)
+    runs, first = np.unique(h_labels[ys, xs], return_index=True)
+    h, w = ink.shape
+    tallest = strokes.max(initial=0)
+    for run, y, x in zip(runs, ys[first], xs[first]):
+        length = h_lengths[run]
+        if length >= 4 * tallest:
+            continue
+        near = strokes[max(0, y - length):min(h, y + length),
+                       max(0, x - length):min(w, x + 2 * length)]
+        near = near[near > 0]
+        if near.size and length < 4 * np.percentile(near, 90):
+            horizontal[y, x:x + length] = False
+    return ((horizontal & v_thin & h_like) | (vertical & h_thin & v_like)
+            | (horizontal & vertical))
+
+def remove_ruling_lines(buf, min_length, max_width, background=None):
+    """
+    Paint ruling lines in a dark-on-light uint8 buffer with the background
+    level, in place. Returns the number of pixels erased.
+    """
+    if background is None:
+        background = int(np.bincount(buf.ravel(), minlength=256).argmax())
+    lines = ruling_mask(buf, background, min_length, max_width)
+    buf[lines] = background
+    return int(lines.sum())
+
+def local_mean_std(gray, window):
+    """
+    Mean and standard deviation over a window x window neighbourhood of
+    every pixel, from integral images (window size does not affect cost).
+    The window is clipped at the image border.
+    """
+    h, w = gray.shape
+    r = window // 2
+    g = gray.astype(np.float64)
+    sums = np.zeros((h + 1, w + 1))
+    squares = np.zeros((h + 1, w + 1))
+    np.cumsum(np.cumsum(g, axis=0), axis=1, out=sums[1:, 1:])
+    np.cumsum(np.cumsum(g * g, axis=0), axis=1, out=squares[1:, 1:])
+
+    y0 = np.clip(np.arange(h) - r, 0, h)
+    y1 = np.clip(np.arange(h) + r + 1, 0, h)
+    x0 = np.clip(np.arange(w) - r, 0, w)
+    x1 = np.clip(np.arange(w) + r + 1, 0, w)
+    count = np.outer(y1 - y0, x1 - x0)
+
+    def box(table):
+        rows = table[y1] - table[y0]
+        return rows[:, x1] - rows[:, x0]
+
+    mean = box(sums) / count
+    var = box(squares) / count
+    return mean, np.sqrt(np.maximum(var - mean * mean, 0))
+
+def adaptive_threshold(gray, method, window=31, k=0.2, lowest=None, max_std=None):
+    """
+    Sauvola or Wolf-Jolion binarization of dark text on a light background;
+    returns a 0/255 uint8 image. Wolf normalises by the darkest pixel and
+    the largest local deviation, which callers working in strips pass in
+    for the whole image.
+    """
+    mean, std = local_mean_std(gray, window)
+    if method == "wolf":
+        lowest = gray.min() if lowest is None else lowest
+        max_std = max(std.max() if max_std is None else max_std, 1e-6)
+        threshold = mean - k * (1 - std / max_std) * (mean - lowest)
+    else:
+        threshold = mean * (1 + k * (std / 128 - 1))
+    return np.where(gray > threshold, 255, 0).astype(np.uint8)
+
+# Every projection maps a grey pixel to its own level, so blending them
+# across tiles leaves grey backgrounds untouched
+CHANNEL_PROJECTIONS = ("luma", "red", "green", "blue", "max", "min")
+
+def channel_projection(rgb, name):
+    if name == "luma":
+        # ITU-R 601-2, as PIL's convert('L')
+        return rgb[..., 0] * 0.299 + rgb[..., 1] * 0.587 + rgb[..., 2] * 0.114
+    # np.maximum over the channel planes is several times faster than max(axis=2)
+    if name == "max":
+        return np.maximum(np.maximum(rgb[..., 0], rgb[..., 1]), rgb[..., 2])
+    if name == "min":
+        return np.minimum(np.minimum(rgb[..., 0], rgb[..., 1]), rgb[..., 2])
+    return rgb[..., ("red", "green", "blue").index(name)]
+
+def to_tiles(a, tile):
+    """
+    (H, W) array as (ty, tx, tile * tile) tiles, edge-padded
+    """
+    ty, tx = -(-a.shape[0] // tile), -(-a.shape[1] // tile)
+    a = np.pad(a, ((0, ty * tile - a.shape[0]), (0, tx * tile - a.shape[1])), mode="edge")
+    return a.reshape(ty, tile, tx, tile).swapaxes(1, 2).reshape(ty, tx, tile * tile)
+
+def select_channels(img, tile=32, window=24, max_side=400):
+    """
+    Grayscale version of a colour capture that keeps coloured text legible.
+
+    Projections (luma, one channel, max or min channel) are scored per tile
+    on a thumbnail whose background is a median filter of itself, which
+    removes text strokes but keeps the edges between banners and panels.
+    The score is the 95th percentile distance from that background minus
+    twice the median distance, which penalises background texture, summed
+    with the tiles to the left and right; another projection replaces luma
+    only when it separates clearly better. Those tiles get the projection's
+    own values, inverted where needed so text sits on the same side of the
+    background as it does in luma, blended bilinearly with their neighbours
+    so switching projections does not draw edges. Everything else is the
+    plain L conversion.
+    Returns (image, {projection: tile count}).
+    """
+    rgb_img = img.convert('RGB')
+    factor = max(1, -(-max(img.size) // max_side))
+    small = rgb_img.reduce(factor) if factor > 1 else rgb_img
+    thumb = np.asarray(small, dtype=np.float32)
+    if ((thumb.max(axis=2) - thumb.min(axis=2)) > 24).mean() < 0.002:
+        return rgb_img.convert('L'), {}
+
+    # About 24 pixels across: wider than a line of text's strokes
+    size = max(3, window // factor | 1)
+    thumb_background = np.asarray(small.filter(ImageFilter.MedianFilter(size)),
+                                  dtype=np.float32)
+    thumb_tile = max(4, tile // factor)
+    scores = []
+    lighter = []
+    for name in CHANNEL_PROJECTIONS:
+        signed = to_tiles(channel_projection(thumb, name) -
+                          channel_projection(thumb_background, name), thumb_tile)
+        distance = np.abs(signed)
+        p50, p95 = np.percentile(distance, [50, 95], axis=2)
+        scores.append(p95 - 2 * p50)
+        ink = distance >= np.maximum(p95 / 2, 8)[..., np.newaxis]
+        lighter.append(((signed > 0) & ink).sum(axis=2) - ((signed < 0) & ink).sum(axis=2))
+    # Tiles vote with their left and right neighbours, so a line of text
+    # keeps one projection and polarity without borrowing from the lines
+    # above and below
+    def vote(per_tile):
+        padded = np.pad(np.stack(per_tile), ((0, 0), (0, 0), (1, 1)), mode="edge")
+        return sum(padded[:, :, dx:dx + padded.shape[2] - 2] for dx in range(3))
+
+    scores = vote(scores)
+    lighter = vote(lighter)
+    choice = scores.argmax(axis=0)
+    # Luma unless another projection separates clearly better
+    choice[scores.max(axis=0) <= scores[0] * 1.25 + 24] = 0
+    used = {CHANNEL_PROJECTIONS[k]: int((choice == k).sum()) for k in np.unique(choice)}
+    luma = rgb_img.convert('L')
+    if not choice.any():
+        return luma, used
+
+    # Light text where the luma background is dark, dark text elsewhere
+    dark_background = np.median(to_tiles(channel_projection(thumb_background, "luma"),
+                                         thumb_tile), axis=2) < 128
+    invert = (np.take_along_axis(lighter, choice[np.newaxis], 0)[0] > 0) != dark_background
+    variant = choice * 2 + (invert & (choice > 0))
+
+    # Only tiles next to a non-luma tile are blended, at full resolution in uint8
+    rows = np.flatnonzero(choice.any(axis=1))
+    cols = np.flatnonzero(choice.any(axis=0))
+    ty, tx = choice.shape
+    w, h = rgb_img.size
+    top, bottom = (max(0, rows[0] - 1) * h // ty, min(ty, rows[-1] + 2) * h // ty)
+    left, right = (max(0, cols[0] - 1) * w // tx, min(tx, cols[-1] + 2) * w // tx)
+    out = np.array(luma)
+    crop = np.asarray(rgb_img)[top:bottom, left:right]
+    total = np.zeros(crop.shape[:2], dtype=np.uint32)
+    weights = np.zeros(crop.shape[:2], dtype=np.uint16)
+    for v in np.unique(variant):
+        name = CHANNEL_PROJECTIONS[v // 2]
+        if name == "luma":
+            values = out[top:bottom, left:right]
+        elif name in ("max", "min"):
+            values = channel_projection(crop, name)
+        else:
+            values = crop[..., ("red", "green", "blue").index(name)]
+        if v % 2:
+            values = 255 - values
+        weight = np.asarray(Image.fromarray(((variant == v) * 255).astype(np.uint8)).resize(
+            (w, h), Image.BILINEAR))[top:bottom, left:right].astype(np.uint16)
+        total += weight * values
+        weights += weight
+    out[top:bottom, left:right] = (total + weights // 2) // np.maximum(weights, 1)
+    return Image.fromarray(out), used
+
+def normalize_polarity(buf, tile=48):
+    """
+    Invert regions with light text on a darker background, in place.
+
+    The background of each tile is the mode of a 16-bin histogram taken over
+    the tile and its eight neighbours, so bold text filling a tile does not
+    flip the decision. Foreground is whatever in the tile itself lies well
+    away from that mode; a tile is inverted when its foreground is mostly
+    lighter than the background. Tiles with no foreground follow their
+    decided neighbours on a similar background.
+    Returns the fraction of tiles inverted.
+    """
+    h, w = buf.shape
+    ty, tx = -(-h // tile), -(-w // tile)
+
+    # Per-tile 16-bin histograms, one row of tiles at a time
+    counts = np.zeros((ty, tx, 16), dtype=np.int64)
+    col_tile = (np.arange(w) // tile).astype(np.int32) * 16
+    for row in range(ty):
+        strip = buf[row * tile:(row + 1) * tile]
+        idx = col_tile + (strip >> 4)
+        counts[row] = np.bincount(idx.ravel(), minlength=tx * 16).reshape(tx, 16)
+
+    padded = np.pad(counts, ((1, 1), (1, 1), (0, 0)))
+    neighbourhood = sum(
+        padded[dy:dy + ty, dx:dx + tx] for dy in range(3) for dx in range(3)
+    )
+    background = neighbourhood.argmax(axis=2)[..., np.newaxis]
+    bins = np.arange(16)
+    lighter = (counts * (bins > background + 2)).sum(axis=2)
+    darker = (counts * (bins < background - 2)).sum(axis=2)
+    has_foreground = (lighter + darker) * 200 > counts.sum(axis=2)
+    invert = has_foreground & (lighter > darker)
+
+    # Tiles without foreground copy the majority decision of neighbouring
+    # decided tiles on a similar background, spreading out ring by ring;
+    # tiles never reached stay as they are
+    background = background[..., 0]
+    decided = has_foreground.copy()
+    for _ in range(ty + tx):
+        votes = np.zeros((ty, tx), dtype=np.int32)
+        reached = np.zeros((ty, tx), dtype=bool)
+        for dy in (-1, 0, 1):
+            for dx in (-1, 0, 1):
+                src = (slice(max(dy, 0), ty + min(dy, 0)), slice(max(dx, 0), tx + min(dx, 0)))
+                dst = (slice(max(-dy, 0), ty + min(-dy, 0)), slice(max(-dx, 0), tx + min(-dx, 0)))
+                near = decided[src] & (np.abs(background[src] - background[dst]) <= 2)
+                votes[dst] += np.where(near, np.where(invert[src], 1, -1), 0)
+                reached[dst] |= near
+        reached &= ~decided
+        if not reached.any():
+            break
+        invert |= reached & (votes > 0)
+        decided |= reached
+
+    for row in np.flatnonzero(invert.any(axis=1)):
+        strip = buf[row * tile:(row + 1) * tile]
+        mask = np.repeat(invert[row], tile)[:w]
+        np.subtract(255, strip, out=strip, where=mask[np.newaxis, :])
+
+    return invert.mean()
+
+def enhance_image_bounded(temp_path, config, light=False):
+    """
+    Memory-bounded variant of enhance_image_for_ocr for very large captures:
+    same stages, run in strips over one uint8 buffer. light=True stops after
+    grayscale, polarity and ruling removal (such captures are not upscaled).
+    """
+    memory = StageMemory(config["max_preprocess_rss_mb"])
+    strip_height = config["bounded_strip_height"]
+
+    img = Image.open(temp_path)
+    w, h = img.size
+    bands = len(img.getbands())
+    # Decoded image plus the grayscale buffer must fit under the cap
+    needed_mb = current_rss_mb() + w * h * (bands + 1) / (1024 * 1024)
+    if needed_mb > config["max_preprocess_rss_mb"]:
+        raise MemoryError(f"{w}x{h} capture needs ~{needed_mb:.0f} MB, "
+                          f"cap is {config['max_preprocess_rss_mb']} MB")
+    log_debug(f"Bounded preprocessing: {w}x{h}, strips of {strip_height} rows")
+
+    # Grayscale conversion strip by strip, then drop the decoded image
+    buf = np.empty((h, w), dtype=np.uint8)
+    img.load()
+    for y0 in range(0, h, strip_height):
+        y1 = min(y0 + strip_height, h)
+        buf[y0:y1] = np.asarray(img.crop((0, y0, w, y1)).convert('L'))
+    img.close()
+    del img
+    memory.mark("grayscale")
+
+    if config["polarity_fix"]:
+        inverted = normalize_polarity(buf, config["polarity_tile"])
+        log_debug(f"Polarity: inverted {inverted:.0%} of tiles")
+        memory.mark("polarity")
+
+    if config["ruling_removal"]:
+        hist = np.zeros(256, dtype=np.int64)
+        for y0 in range(0, h, strip_height):
+            hist += np.bincount(buf[y0:y0 + strip_height].ravel(), minlength=256)
+        background = int(hist.argmax())
+        min_length, max_width = config["ruling_min_length"], config["ruling_max_width"]
+
+        def erase(chunk):
+            remove_ruling_lines(chunk, min_length, max_width, background)
+            return chunk
+
+        # A halo of min_length rows keeps vertical lines across strip edges long enough
+        filter_in_strips(buf, strip_height, erase, halo=min_length)
+        memory.mark("rulings")
+
+    if light:
+        Image.frombuffer('L', (w, h), buf, 'raw', 'L', 0, 1).save(temp_path)
+        memory.mark("save")
+        log_debug("Bounded light preprocessing complete")
+        return memory.peaks
+
+    if config["binarization"] != "none":
+        method, window, k = (config["binarization"], config["binarize_window"],
+                             config["binarize_k"])
+        lowest = max_std = None
+        if method == "wolf":
+            # Whole-image terms first, so every strip uses the same normalisation
+            lowest = int(min(buf[y0:y0 + strip_height].min() for y0 in range(0, h, strip_height)))
+            max_std = max(local_mean_std(buf[y0:y0 + strip_height], window)[1].max()
+                          for y0 in range(0, h, strip_height))
+        filter_in_strips(buf, strip_height,
+                         lambda chunk: adaptive_threshold(chunk, method, window, k,
+                                                          lowest, max_std),
+                         halo=window // 2)
+        memory.mark("binarize")
+        Image.frombuffer('L', (w, h), buf, 'raw', 'L', 0, 1).save(temp_path)
+        memory.mark("save")
+        log_debug(f"Bounded {method} binarization complete")
+        return memory.peaks
+
+    filter_in_strips(buf, strip_height, pil_filter(ImageFilter.MedianFilter(size=3)))
+    memory.mark("median")
+
+    # Contrast statistics from a streamed histogram instead of a float copy
+    hist = np.zeros(256, dtype=np.int64)
+    for y0 in range(0, h, strip_height):
+        hist += np.bincount(buf[y0:y0 + strip_height].ravel(), minlength=256)
+    levels = np.arange(256)
+    mean = (hist * levels).sum() / hist.sum()
+    contrast = np.sqrt((hist * (levels - mean) ** 2).sum() / hist.sum())
+    memory.mark("stats")
+
+    if contrast < 40:
+        # Same mapping as ImageEnhance.Contrast(1.3), applied as an in-place LUT
+        pivot = int(mean + 0.5)
+        lut = np.clip(pivot + 1.3 * (levels - pivot), 0, 255).astype(np.uint8)
+        for y0 in range(0, h, strip_height):
+            strip = buf[y0:y0 + strip_height]
+            np.take(lut, strip, out=strip)
+        log_debug("Applied gentle contrast enhancement")
+        memory.mark("contrast")
+
+    filter_in_strips(buf, strip_height,
+                     pil_filter(ImageFilter.UnsharpMask(radius=1, percent=100, threshold=3)))
+    memory.mark("sharpen")
+
+    # Wrap the buffer without copying it for the encoder
+    Image.frombuffer('L', (w, h), buf, 'raw', 'L', 0, 1).save(temp_path)
+    memory.mark("save")
+    log_debug("Bounded image enhancement complete")
+    return memory.peaks
+
+def detect_text_presence(temp_path, max_side=800):
+    """
+    Cheap text-presence check on a thumbnail using edge statistics.
+    Returns (maybe_text, features); maybe_text is False only when confident.
+
+    Screen text has strong, mostly axis-aligned edges, a few dominant grey
+    levels, and empty rows between lines. Photos and blank areas do not.
+    """
+    img = Image.open(temp_path)
+    factor = -(-max(img.size) // max_side)
+    if factor > 1:
+        img = img.reduce(factor)
+    a = np.asarray(img.convert('L'), dtype=np.int16)
+
+    dx = np.abs(np.diff(a, axis=1))[:-1, :]
+    dy = np.abs(np.diff(a, axis=0))[:, :-1]
+    strong = (dx + dy) > 32
+    edges = int(strong.sum())
+    features = {"edges": edges, "edge_density": edges / max(1, strong.size)}
+    # Blank or smooth area; a single short word still leaves dozens of edges
+    if edges < 16:
+        return False, features
+
+    axis = strong & ((dx > 2 * dy) | (dy > 2 * dx))
+    features["axis_ratio"] = int(axis.sum()) / edges
+
+    hist = np.bincount((a >> 2).ravel(), minlength=64)
+    features["dominance"] = np.sort(hist)[-4:].sum() / a.size
+
+    rows = strong.mean(axis=1)
+    features["gap_rows"] = float((rows < rows.max() * 0.1).mean())
+
+    photo_like = (features["dominance"] < 0.5 and features["axis_ratio"] < 0.6
+                  and features["gap_rows"] < 0.1)
+    return not photo_like, features
+
+def resolve_content_mode(config, window_name=""):
+    """
+    Turn content_mode "auto" into a concrete mode using the window title
+    """
+    mode = config["content_mode"]
+    if mode != "auto":
+        return mode
+    title = window_name.lower()
+    for candidate, patterns in config["content_mode_rules"].items():
+        if any(pattern in title for pattern in patterns):
+            return candidate
+    return "text"
+
+def apply_content_mode(config, mode):
+    """
+    Config with the PSM order and post-correction setting for a content mode
+    """
+    settings = CONTENT_MODES[mode]
+    config = dict(config, content_mode=mode)
+    if "psm_order" in settings:
+        config["ocr_psm_order"] = settings["psm_order"]
+        if POWER_PROFILE["profile"] == "battery":
+            config["ocr_psm_order"] = config["ocr_psm_order"][:1]
+    if not settings.get("post_correction", True):
+        config["post_correction"] = False
+    return config
+
+def upscale_factor(w, h, config):
+    if w < config["upscale_min_width"] or h < config["upscale_min_height"]:
+        return 2 if min(w, h) < 200 else 1.5
+    return 1
+
+def enhance_image_for_ocr(temp_path, config=None, light=False, dest=None, stop=None):
+    """
+    Enhanced image preprocessing that preserves quality.
+    light=True stops after grayscale, polarity and upscaling; the result
+    goes to dest if given, otherwise it replaces temp_path.
+    Setting the optional stop event abandons it between stages (returns False).
+    """
+    config = config or DEFAULT_CONFIG
+    dest = dest or temp_path
+
+    def abandoned(stage):
+        if stop and stop.is_set():
+            log_debug(f"Image preprocessing abandoned after {stage}")
+            return True
+        return False
+
+    try:
+        img = Image.open(temp_path)
+        log_debug(f"Original image: {img.size}, mode: {img.mode}")
+
+        if img.size[0] * img.size[1] >= config["bounded_min_pixels"]:
+            img.close()
+            if dest != temp_path:
+                shutil.copy(temp_path, dest)
+            enhance_image_bounded(dest, config, light)
+            return True
+
+        # Convert to grayscale
+        if img.mode != 'L' and config["channel_selection"]:
+            img, used = select_channels(img, config["channel_tile"])
+            if used:
+                log_debug(f"Channel selection (tiles per projection): {used}")
+        elif img.mode != 'L':
+            img = img.convert('L')
+        if abandoned("grayscale"):
+            return False
+
+        # Dark text on a light background, region by region
+        if config["polarity_fix"]:
+            buf = np.array(img)
+            inverted = normalize_polarity(buf, config["polarity_tile"])
+            if inverted:
+                img = Image.fromarray(buf)
+            log_debug(f"Polarity: inverted {inverted:.0%} of tiles")
+            del buf
+        if abandoned("polarity"):
+            return False
+
+        if config["ruling_removal"]:
+            buf = np.array(img)
+            erased = remove_ruling_lines(buf, config["ruling_min_length"],
+                                         config["ruling_max_width"])
+            if erased:
+                img = Image.fromarray(buf)
+                log_debug(f"Ruling lines: erased {erased} pixels")
+            del buf
+        if abandoned("ruling removal"):
+            return False
+
+        # Only apply enhancements if image is small or low quality
+        w, h = img.size
+
+        # Smart upscaling for small images
+        scale_factor = upscale_factor(w, h, config)
+        if scale_factor > 1:
+            new_w, new_h = int(w * scale_factor), int(h * scale_factor)
+            img = img.resize((new_w, new_h), Image.LANCZOS)
+            log_debug(f"Upscaled to: {new_w}x{new_h}")
+        if abandoned("upscaling"):
+            return False
+
+        if light:
+            img.save(dest)
+            log_debug("Light image preprocessing complete")
+            return True
+
+        if config["binarization"] != "none":
+            img = Image.fromarray(adaptive_threshold(
+                np.asarray(img), config["binarization"], config["binarize_window"],
+                config["binarize_k"]))
+            img.save(dest)
+            log_debug(f"Applied {config['binarization']} binarization")
+            return True
+
+        # Very gentle noise reduction (much less aggressive than before)
+        img = img.filter(ImageFilter.MedianFilter(size=3))
+
+        # Smart contrast enhancement based on image statistics
+        img_array = np.array(img)
+        contrast = np.std(img_array)
+
+        if contrast < 40:  # Only enhance low-contrast images
+            enhancer = ImageEnhance.Contrast(img)
+            img = enhancer.enhance(1.3)  # Much gentler than 2.0
+            log_debug("Applied gentle contrast enhancement")
+
+        # Gentle sharpening instead of harsh threshold
+        img = img.filter(ImageFilter.UnsharpMask(radius=1, percent=100, threshold=3))
+
+        if abandoned("filtering"):
+            return False
+        # Save the enhanced image
+        img.save(dest)
+        log_debug("Image enhancement complete")
+        return True
+
+    except Exception as e:
+        log_debug(f"Image enhancement failed: {e}")
+        log_error(e)
+        return False
+
+# Page segmentation modes:
+#   6  - single uniform block (UI text, paragraphs)
+#   11 - sparse text (menus, scattered text)
+#   7  - single line (titles, labels)
+#   3  - fully automatic fallback
+def run_ocr_with_best_settings(temp_path, stats=None, config=None, stop=None, group=None):
+    """
+    Run OCR with optimized Tesseract settings.
+    If a stats dict is given, the chosen config is recorded in it.
+    With ocr_workers > 1 the configs run in parallel under the thread budget.
+    Setting the optional stop event abandons the remaining configs; the
+    Tesseract processes are tracked in group if given.
+    """
+    config = config or DEFAULT_CONFIG
+    mode_params = CONTENT_MODES.get(config["content_mode"], CONTENT_MODES["text"])["params"]
+
+    # Extra renderers are written by the same recognition pass, to files
+    renderers = output_renderers(config)
+    outputs = [f"{temp_path}.out{i}" if renderers else "stdout"
+               for i in range(len(config["ocr_psm_order"]))]
+
+    # Try multiple OCR approaches
+    ocr_configs = [
+        ["tesseract", temp_path, output, "--psm", str(psm), "--oem", "1"] + mode_params
+        + (["txt"] + renderers if renderers else [])
+        for output, psm in zip(outputs, config["ocr_psm_order"])
+    ]
+
+    if config["ocr_workers"] > 1:
+        return run_ocr_configs_parallel(ocr_configs, config["ocr_workers"], stats, stop, group)
+
+    best_result = ""
+    best_length = 0
+
+    for i, cmd in enumerate(ocr_configs):
+        if CANCEL_EVENT.is_set() or (stop and stop.is_set()):
+            break
+        if stats is not None:
+            stats["configs_tried"] = i + 1
+        start = time.perf_counter()
+        text = run_ocr_config(i, cmd, group, stop)
+        if stats is not None:
+            stats.setdefault("config_timings", {})[f"psm={cmd[4]}"] = time.perf_counter() - start
+
+        if text and len(text) > best_length:
+            best_result = text
+            best_length = len(text)
+            if stats is not None:
+                stats["config"] = f"psm={cmd[4]} oem={cmd[6]}"
+                stats["output_base"] = cmd[2]
+
+            # If first config works well, use it
+            if i == 0 and len(text) > 5:
+                break
+
+    return best_result
+
+def run_ocr_config(i, cmd, group=None, stop=None):
+    try:
+        log_debug(f"Trying OCR config {i+1}: PSM={cmd[4]}")
+
+        result = run_tesseract(cmd, timeout=20, group=group, stop=stop)
+
+        if cmd[2] == "stdout":
+            text = result.stdout.strip()
+        elif os.path.exists(cmd[2] + ".txt"):
+            with open(cmd[2] + ".txt") as f:
+                text = f.read().strip()
+        else:
+            text = ""
+        if text:
+            log_debug(f"Config {i+1} found {len(text)} characters")
+        return text
+
+    except subprocess.TimeoutExpired:
+        log_debug(f"Config {i+1} timed out")
+    except Exception as e:
+        log_debug(f"Config {i+1} failed: {e}")
+    return ""
+
+def run_ocr_configs_parallel(ocr_configs, workers, stats=None, stop=None, group=None):
+    """
+    Run all configs concurrently; a good first-config result wins outright
+    and the remaining Tesseract processes of this call are killed
+    """
+    first_done = threading.Event()
+    timings = {}
+    group = set() if group is None else group
+
+    def run(i, cmd):
+        if first_done.is_set() or CANCEL_EVENT.is_set() or (stop and stop.is_set()):
+            return ""
+        start = time.perf_counter()
+        text = run_ocr_config(i, cmd, group, (stop, first_done))
+        timings[f"psm={cmd[4]}"] = time.perf_counter() - start
+        if i == 0 and len(text) > 5:
+            first_done.set()
+            kill_active_tesseract(group)
+        return text
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(run, i, cmd) for i, cmd in enumerate(ocr_configs)]
+        results = [future.result() for future in futures]
+
+    if stats is not None:
+        stats["configs_tried"] = len(ocr_configs)
+        stats["config_timings"] = timings
+    if first_done.is_set():
+        best = 0
+    else:
+        best = max(range(len(results)), key=lambda i: len(results[i]))
+    if results[best] and stats is not None:
+        cmd = ocr_configs[best]
+        stats["config"] = f"psm={cmd[4]} oem={cmd[6]}"
+        stats["output_base"] = cmd[2]
+    return results[best]
+
+def output_renderers(config):
+    """
+    Tesseract renderers (besides txt) needed for the clipboard and file formats
+    """
+    formats = set(config["save_formats"]) | {config["clipboard_format"]}
+    renderers = []
+    # The flight recorder keeps every config's TSV; the line cache learns
+    # from the winning config's lines
+    if formats & {"tsv", "json", "html"} or config["flight_recorder"] or config["line_cache"]:
+        renderers.append("tsv")
+    if "hocr" in formats:
+        renderers.append("hocr")
+    return renderers
+
+def render_html(text, lines=None):
+    """
+    HTML for the clipboard: one paragraph per Tesseract block, line breaks kept
+    """
+    if not lines:
+        return "<p>" + "<br>\n".join(html.escape(line) for line in text.split("\n")) + "</p>"
+    blocks = {}
+    for line in lines:
+        blocks.setdefault(line["block"], []).append(html.escape(line["text"]))
+    return "\n".join("<p>" + "<br>\n".join(block) + "</p>" for block in blocks.values())
+
+def render_json(text, stats):
+    return json.dumps({
+        "text": text,
+        "config": stats.get("config"),
+        "confidence": stats.get("confidence"),
+        "lines": stats.get("lines", []),
+    }, indent=2)
+
+def write_outputs(text, stats, config):
+    """
+    Write the requested file formats for one capture; returns the paths
+    """
+    out_dir = os.path.expanduser(config["output_dir"])
+    os.makedirs(out_dir, exist_ok=True)
+    base = os.path.join(out_dir, time.strftime("xclip-ocr-%Y%m%d-%H%M%S"))
+    paths = []
+    for fmt in config["save_formats"]:
+        path = f"{base}.{fmt}"
+        if fmt == "txt":
+            with open(path, "w") as f:
+                f.write(text + "\n")
+        elif fmt == "json":
+            with open(path, "w") as f:
+                f.write(render_json(text, stats))
+        elif "output_base" in stats and os.path.exists(f"{stats['output_base']}.{fmt}"):
+            shutil.copy(f"{stats['output_base']}.{fmt}", path)
+        else:
+            log_debug(f"No {fmt} output available for this capture")
+            continue
+        paths.append(path)
+    return paths
+
+def parse_tsv_lines(tsv):
+    """
+    Group Tesseract TSV word rows into lines with text, mean word
+    confidence and bounding box, in reading order
+    """
+    lines = {}
+    for row in tsv.splitlines()[1:]:
+        fields = row.split("\t")
+        if len(fields) < 12 or fields[0] != "5" or not fields[11].strip():
+            continue
+        key = (int(fields[2]), int(fields[3]), int(fields[4]))
+        left, top, width, height = (int(v) for v in fields[6:10])
+        line = lines.setdefault(key, {"words": [], "confs": [],
+                                      "box": [left, top, left + width, top + height]})
+        line["words"].append({"text": fields[11], "conf": float(fields[10]),
+                              "box": (left, top, left + width, top + height)})
+        line["confs"].append(float(fields[10]))
+        box = line["box"]
+        box[0], box[1] = min(box[0], left), min(box[1], top)
+        box[2], box[3] = max(box[2], left + width), max(box[3], top + height)
+
+    result = []
+    for key in sorted(lines):
+        line = lines[key]
+        result.append({
+            "text": " ".join(word["text"] for word in line["words"]),
+            "conf": sum(line["confs"]) / len(line["confs"]),
+            "box": tuple(line["box"]),
+            "block": key[0],
+            "words": line["words"],
+        })
+    return result
+
+def run_tesseract_lines(image_path, psm, config, tessdata_dir=None, group=None, stop=None):
+    """
+    One Tesseract pass with TSV output, returned as parsed lines
+    """
+    cmd = ["tesseract", image_path, "stdout", "--psm", str(psm), "--oem", "1"]
+    if tessdata_dir:
+        cmd += ["--tessdata-dir", tessdata_dir]
+    cmd += CONTENT_MODES.get(config["content_mode"], CONTENT_MODES["text"])["params"]
+    cmd += ["tsv"]
+    result = run_tesseract(cmd, timeout=20, group=group, stop=stop)
+    return parse_tsv_lines(result.stdout)
+
+def ocr_composite(image_path, boxes, config, tessdata_dir=None, gap=24):
+    """
+    OCR several line crops with a single Tesseract run by stacking them
+    into one composite image. Returns (text, conf) per box.
+    """
+    with Image.open(image_path) as img:
+        crops = [img.crop(box).convert('L') for box in boxes]
+    return [(" ".join(line["text"] for line in lines),
+             sum(line["conf"] for line in lines) / len(lines) if lines else -1)
+            for lines in ocr_stacked(crops, config, tessdata_dir, gap)]
+
+def ocr_stacked(images, config, tessdata_dir=None, gap=24):
+    """
+    One Tesseract run over grayscale images stacked top to bottom with
+    white gaps; returns the recognised lines of each image
+    """
+    width = max(image.width for image in images) + 2 * gap
+    height = sum(image.height + gap for image in images) + gap
+    composite = Image.new('L', (width, height), 255)
+    spans = []
+    y = gap
+    for image in images:
+        composite.paste(image, (gap, y))
+        spans.append((y, y + image.height))
+        y += image.height + gap
+
+    with tempfile.NamedTemporaryFile(suffix=".png", delete=False) as f:
+        composite_path = f.name
+    try:
+        composite.save(composite_path)
+        lines = run_tesseract_lines(composite_path, 6, config, tessdata_dir)
+    finally:
+        os.remove(composite_path)
+
+    # Each recognised line belongs to the image its vertical centre falls in
+    results = [[] for _ in images]
+    for line in lines:
+        centre = (line["box"][1] + line["box"][3]) / 2
+        for i, (top, bottom) in enumerate(spans):
+            if top - gap / 2 <= centre < bottom + gap / 2:
+                results[i].append(line)
+                break
+    return results
+
+def cascade_available(config):
+    return (config["model_cascade"] and os.path.isdir(config["tessdata_fast"])
+            and os.path.isdir(config["tessdata_best"]))
+
+def run_ocr_cascade(temp_path, stats, config):
+    """
+    Fast model on a lightly preprocessed image first; only low-confidence
+    lines are re-read with the best model on the fully preprocessed image.
+    Returns None when the fast pass finds nothing, so the caller can fall
+    back to the regular pipeline.
+    """
+    light_path = temp_path + ".light.png"
+    try:
+        enhance_image_for_ocr(temp_path, config, light=True, dest=light_path)
+        lines = run_tesseract_lines(light_path, config["ocr_psm_order"][0], config,
+                                    config["tessdata_fast"])
+    finally:
+        if os.path.exists(light_path):
+            os.remove(light_path)
+    if not lines:
+        return None
+
+    threshold = config["cascade_min_confidence"]
+    weak = [i for i, line in enumerate(lines) if line["conf"] < threshold]
+    log_debug(f"Cascade: {len(weak)}/{len(lines)} line(s) below confidence {threshold}")
+
+    if weak and not CANCEL_EVENT.is_set():
+        # Same upscaling rule as the light pass, so line boxes still line up
+        enhance_image_for_ocr(temp_path, config)
+        pad = 4
+        boxes = [(max(0, lines[i]["box"][0] - pad), max(0, lines[i]["box"][1] - pad),
+                  lines[i]["box"][2] + pad, lines[i]["box"][3] + pad) for i in weak]
+        for i, (text, conf) in zip(weak, ocr_composite(temp_path, boxes, config,
+                                                       config["tessdata_best"])):
+            if text and conf > lines[i]["conf"]:
+                lines[i] = dict(lines[i], text=text, conf=conf)
+
+    stats["configs_tried"] = 2 if weak else 1
+    stats["config"] = f"cascade psm={config['ocr_psm_order'][0]}"
+    stats["confidence"] = sum(line["conf"] for line in lines) / len(lines)
+    stats["lines"] = lines
+    stats["cascade_lines"] = len(lines)
+    stats["cascade_escalated"] = len(weak)
+    totals = record_stats(cascade_runs=1, cascade_escalated_runs=int(bool(weak)),
+                          cascade_lines=len(lines), cascade_escalated_lines=len(weak))
+    log_debug(f"Cascade escalation rate: {totals['cascade_escalated_lines']}/"
+              f"{totals['cascade_lines']} lines, {totals['cascade_escalated_runs']}/"
+              f"{totals['cascade_runs']} runs")
+    return "\n".join(line["text"] for line in lines)
+
+def segment_lines(gray, max_height=120):
+    """
+    Split a grayscale capture into text-line bands with a horizontal ink
+    projection. Returns (left, top, right, bottom) per band, or None when
+    the capture does not split into plain lines (panels, images).
+    """
+    background = int(np.bincount(gray.ravel(), minlength=256).argmax())
+    ink = np.abs(gray.astype(np.int16) - background) > 48
+    rows = ink.any(axis=1)
+    # Bridge one-row gaps (dots of i and j above lowercase-only lines)
+    rows[1:-1] |= rows[:-2] & rows[2:]
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], rows.view(np.int8), [0]))))
+    bands = []
+    for top, bottom in zip(edges[0::2], edges[1::2]):
+        if bottom - top > max_height:
+            return None
+        cols = np.flatnonzero(ink[top:bottom].any(axis=0))
+        bands.append((int(cols[0]), int(top), int(cols[-1]) + 1, int(bottom)))
+    return bands
+
+class LineCache:
+    """
+    Recognised text keyed on the exact pixels of each segmented line,
+    so only lines not seen before go to Tesseract
+    """
+
+    def __init__(self, config, db_path=None):
+        db_path = db_path or LINE_CACHE_DB
+        self.config = config
+        self.bands = None
+        self.keys = None
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.db = sqlite3.connect(db_path, timeout=5)
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS lines (
+                key TEXT PRIMARY KEY,
+                text TEXT NOT NULL,
+                conf REAL,
+                used REAL
+            );
+            CREATE INDEX IF NOT EXISTS lines_used ON lines(used);
+        """)
+
+    def _segment(self, temp_path):
+        with Image.open(temp_path) as img:
+            gray = np.asarray(img.convert('L'))
+        self.size = (gray.shape[1], gray.shape[0])
+        self.bands = segment_lines(gray)
+        if not self.bands:
+            return False
+        # The content mode's Tesseract params change what a line reads as
+        salt = self.config["content_mode"].encode()
+        self.keys = [hashlib.sha1(salt + f"{right - left}x{bottom - top}".encode()
+                                  + gray[top:bottom, left:right].tobytes()).hexdigest()
+                     for left, top, right, bottom in self.bands]
+        return True
+
+    def recognize(self, temp_path, stats):
+        """
+        Text for a capture from cached lines, OCR'ing only the misses in one
+        composite image. Returns None when no line is cached, leaving the
+        capture to the regular pipeline.
+        """
+        if not self._segment(temp_path):
+            log_debug("Line cache: capture does not segment into lines")
+            return None
+        rows = {}
+        for i in range(0, len(self.keys), 500):
+            chunk = self.keys[i:i + 500]
+            rows.update((key, (text, conf)) for key, text, conf in self.db.execute(
+                f"SELECT key, text, conf FROM lines WHERE key IN ({','.join('?' * len(chunk))})",
+                chunk))
+        log_debug(f"Line cache: {len(rows)}/{len(self.keys)} line(s) cached")
+        record_stats(line_cache_runs=1, line_cache_lines=len(self.keys),
+                     line_cache_hits=len(rows))
+        if not rows:
+            return None
+
+        misses = [i for i, key in enumerate(self.keys) if key not in rows]
+        if misses:
+            light_path = temp_path + ".light.png"
+            try:
+                enhance_image_for_ocr(temp_path, self.config, light=True, dest=light_path)
+                scale = upscale_factor(*self.size, self.config)
+                pad = 4
+                boxes = [(max(0, int(left * scale) - pad), max(0, int(top * scale) - pad),
+                          int(right * scale) + pad, int(bottom * scale) + pad)
+                         for left, top, right, bottom in (self.bands[i] for i in misses)]
+                results = ocr_composite(light_path, boxes, self.config)
+            finally:
+                if os.path.exists(light_path):
+                    os.remove(light_path)
+            for i, (text, conf) in zip(misses, results):
+                rows[self.keys[i]] = (text, conf)
+            self._store([(self.keys[i], text, conf)
+                         for i, (text, conf) in zip(misses, results) if text])
+
+        now = time.time()
+        self.db.executemany("UPDATE lines SET used = ? WHERE key = ?",
+                            [(now, key) for key in self.keys])
+        self.db.commit()
+
+        lines = [{"text": rows[key][0], "conf": rows[key][1], "box": band, "block": 1,
+                  "words": []}
+                 for key, band in zip(self.keys, self.bands) if rows[key][0]]
+        stats["configs_tried"] = 1 if misses else 0
+        stats["config"] = "line cache psm=6"
+        stats["confidence"] = (sum(line["conf"] for line in lines) / len(lines)
+                               if lines else None)
+        stats["lines"] = lines
+        return "\n".join(line["text"] for line in lines)
+
+    def learn(self, stats):
+        """
+        Store the lines of a regular pipeline result under the bands found
+        by recognize(). A band is only stored when every Tesseract line
+        that falls in it fits inside it.
+        """
+        if not self.bands or not stats.get("lines"):
+            return
+        # Raw speculation reads the capture as is; other paths OCR it upscaled
+        scale = 1 if stats.get("config", "").startswith("raw") \
+            else upscale_factor(*self.size, self.config)
+        tops = np.array([band[1] for band in self.bands])
+        found = {}
+        for line in stats["lines"]:
+            left, top, right, bottom = (v / scale for v in line["box"])
+            i = int(np.searchsorted(tops, (top + bottom) / 2, side="right")) - 1
+            band = self.bands[max(i, 0)]
+            fits = i >= 0 and top >= band[1] - 3 and bottom <= band[3] + 3
+            found.setdefault(i, []).append((left, line) if fits else None)
+        entries = []
+        for i, parts in found.items():
+            if None in parts:
+                continue
+            parts.sort(key=lambda part: part[0])
+            entries.append((self.keys[i], " ".join(line["text"] for _, line in parts),
+                            sum(line["conf"] for _, line in parts) / len(parts)))
+        self._store(entries)
+        log_debug(f"Line cache: learned {len(entries)}/{len(self.bands)} line(s)")
+
+    def _store(self, entries):
+        now = time.time()
+        self.db.executemany("INSERT OR REPLACE INTO lines VALUES (?, ?, ?, ?)",
+                            [(key, text, conf, now) for key, text, conf in entries])
+        self.db.execute(
+            "DELETE FROM lines WHERE key IN "
+            "(SELECT key FROM lines ORDER BY used DESC LIMIT -1 OFFSET ?)",
+            (self.config["line_cache_max_entries"],))
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+def app_name_from_title(window):
+    """
+    "main.py - Visual Studio Code" -> "Visual Studio Code"
+    """
+    return re.split(r" [-—–] ", window)[-1].strip() if window else "unknown"
+
+def speculation_enabled(config, app):
+    if not config["speculative_raw"]:
+        return False
+    try:
+        with open(STATS_PATH) as f:
+            totals = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return True
+    runs = totals.get(f"speculative_runs:{app}", 0)
+    wins = totals.get(f"speculative_raw_wins:{app}", 0)
+    if runs >= config["speculative_min_samples"] and wins / runs < config["speculative_min_win_rate"]:
+        skipped = record_stats(**{f"speculative_skipped:{app}": 1})[f"speculative_skipped:{app}"]
+        if config["speculative_retry_every"] and skipped % config["speculative_retry_every"] == 0:
+            log_debug(f"Speculation re-trial for {app}: raw won {wins}/{runs}")
+            return True
+        log_debug(f"Speculation off for {app}: raw won {wins}/{runs}")
+        return False
+    return True
+
+def run_ocr_speculative(temp_path, stats, config, app):
+    """
+    Race Tesseract on the raw capture against preprocessing plus the regular
+    configs. A confident raw result wins and is returned right away; the
+    enhanced path is abandoned and removes its copy when it winds down.
+    Otherwise the enhanced copy is left next to temp_path for the caller
+    to remove.
+    """
+    enhanced_path = temp_path + ".enhanced.png"
+    any_done = threading.Condition()
+    stop_enhanced = threading.Event()
+    stop_raw = threading.Event()
+    raw = {}
+    enhanced = {}
+    enhanced_stats = {}
+    raw_group = set()
+    enhanced_group = set()
+
+    def run_raw():
+        try:
+            raw["lines"] = run_tesseract_lines(temp_path, config["ocr_psm_order"][0], config,
+                                               group=raw_group, stop=stop_raw)
+        except Exception as e:
+            log_debug(f"Speculative raw OCR failed: {e}")
+            raw["lines"] = []
+        with any_done:
+            any_done.notify_all()
+
+    def run_enhanced():
+        try:
+            enhance_image_for_ocr(temp_path, config, dest=enhanced_path, stop=stop_enhanced)
+            if not stop_enhanced.is_set():
+                enhanced["text"] = run_ocr_with_best_settings(
+                    enhanced_path, enhanced_stats, config, stop_enhanced, enhanced_group)
+        finally:
+            with any_done:
+                enhanced.setdefault("text", "")
+                any_done.notify_all()
+            if stop_enhanced.is_set():
+                try:
+                    os.remove(enhanced_path)
+                except FileNotFoundError:
+                    pass
+
+    raw_thread = threading.Thread(target=run_raw, daemon=True)
+    enhanced_thread = threading.Thread(target=run_enhanced, daemon=True)
+    raw_thread.start()
+    enhanced_thread.start()
+
+    with any_done:
+        any_done.wait_for(lambda: "lines" in raw or "text" in enhanced)
+
+    winner = "enhanced"
+    lines = raw.get("lines")
+    if lines:
+        confidence = sum(line["conf"] for line in lines) / len(lines)
+        if confidence >= config["speculative_min_confidence"]:
+            winner = "raw"
+            stop_enhanced.set()
+            kill_active_tesseract(enhanced_group)
+            stats["config"] = f"raw psm={config['ocr_psm_order'][0]}"
+            stats["confidence"] = confidence
+            stats["configs_tried"] = 1
+            stats["lines"] = lines
+            text = "\n".join(line["text"] for line in lines)
+
+    if winner == "enhanced":
+        enhanced_thread.join()
+        if "lines" not in raw:
+            # Enhanced path finished first; the raw run is no longer needed
+            stop_raw.set()
+            kill_active_tesseract(raw_group)
+        stats.update(enhanced_stats)
+        text = enhanced["text"]
+    raw_thread.join()
+
+    if CANCEL_EVENT.is_set():
+        # Neither path ran to the end; counting it would read as a raw loss
+        log_debug("Speculation cancelled, not counted")
+        return text
+    totals = record_stats(**{f"speculative_runs:{app}": 1,
+                             f"speculative_raw_wins:{app}": int(winner == "raw")})
+    log_debug(f"Speculation: {winner} path won; raw has won "
+              f"{totals[f'speculative_raw_wins:{app}']}/{totals[f'speculative_runs:{app}']} "
+              f"for {app}")
+    return text
+
+# Suspicious tokens: words containing a digit, a bar or an rn/vv pair.
+# Tokens touching code punctuation (foo_bar1, file.txt, a/b, x=1) are left alone.
+TOKEN_RE = re.compile(
+    r"(?<![\w./\\@#$=-])[A-Za-z0-9|]*(?:[0-9|]|rn|vv)[A-Za-z0-9|]*(?![\w/\\@#$=-]|\.\w)"
+)
+# Folds characters Tesseract confuses into one class, so a misread
+# word and its dictionary form share an index key
+FOLD_RE = re.compile(r"rn|vv|[0o]|[1iIl|]")
+FOLD_MAP = {"rn": "m", "vv": "w", "0": "o", "o": "o"}
+NUMERIC_CONFUSIONS = str.maketrans("OolI|", "00111")
+
+def fold_confusions(word):
+    return FOLD_RE.sub(lambda m: FOLD_MAP.get(m.group(0), "l"), word.lower())
+
+def delete_variants(word, max_distance=1):
+    variants = {word}
+    frontier = {word}
+    for _ in range(max_distance):
+        frontier = {w[:i] + w[i + 1:] for w in frontier for i in range(len(w))}
+        variants |= frontier
+    return variants
+
+def within_one_edit(a, b):
+    """
+    True if a and b differ by at most one insertion, deletion or substitution
+    """
+    if abs(len(a) - len(b)) > 1:
+        return False
+    if len(a) > len(b):
+        a, b = b, a
+    i = 0
+    while i < len(a) and a[i] == b[i]:
+        i += 1
+    if len(a) == len(b):
+        return a[i + 1:] == b[i + 1:]
+    return a[i:] == b[i + 1:]
+
+def build_dictionary_index(words_path, db_path=DICTIONARY_DB, history_path=HISTORY_DB):
+    """
+    Precompute the symmetric-delete index over folded dictionary words.
+    Words seen repeatedly in the OCR history are added with their counts.
+    """
+    freq = Counter()
+    if os.path.exists(words_path):
+        with open(words_path, errors="ignore") as f:
+            for line in f:
+                word = line.strip().lower()
+                if word.isalpha() and word.isascii():
+                    freq[word] += 1
+    if os.path.exists(history_path):
+        history = sqlite3.connect(history_path)
+        seen = Counter()
+        for (text,) in history.execute("SELECT text FROM history"):
+            seen.update(w.lower() for w in re.findall(r"[A-Za-z]{3,}", text))
+        history.close()
+        freq.update({word: count for word, count in seen.items() if count >= 3})
+
+    os.makedirs(os.path.dirname(db_path), exist_ok=True)
+    tmp_path = db_path + ".tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    db = sqlite3.connect(tmp_path)
+    db.executescript("""
+        CREATE TABLE words (word TEXT PRIMARY KEY, folded TEXT, freq INTEGER) WITHOUT ROWID;
+        CREATE TABLE deletes (variant TEXT, word TEXT);
+    """)
+    folded = {word: fold_confusions(word) for word in freq}
+    db.executemany("INSERT INTO words VALUES (?, ?, ?)",
+                   ((word, folded[word], count) for word, count in freq.items()))
+    db.executemany(
+        "INSERT INTO deletes VALUES (?, ?)",
+        ((variant, word) for word in freq for variant in delete_variants(folded[word]))
+    )
+    db.execute("CREATE INDEX words_folded ON words(folded)")
+    db.execute("CREATE INDEX deletes_variant ON deletes(variant)")
+    db.commit()
+    db.close()
+    os.replace(tmp_path, db_path)
+    return len(freq)
+
+class PostCorrector:
+    """
+    Single-pass OCR post-correction: numeric fixes inside numbers, dictionary
+    lookups through the precomputed delete index for suspicious words only
+    """
+
+    def __init__(self, db_path=DICTIONARY_DB):
+        self.db_path = db_path
+        self.db = None
+        self.available = os.path.exists(db_path)
+        self.corrections = 0
+        self.cache = {}
+
+    def _lookup(self, token):
+        if token in self.cache:
+            return self.cache[token]
+        if self.db is None:
+            self.db = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True)
+
+        word = None
+        if not self.db.execute("SELECT 1 FROM words WHERE word = ?", (token.lower(),)).fetchone():
+            folded = fold_confusions(token)
+            # Exact matches after folding are pure confusion fixes
+            candidates = self.db.execute(
+                "SELECT freq, word FROM words WHERE folded = ?", (folded,)
+            ).fetchall()
+            # One further edit is only trusted when the confusables sit inside a long word
+            if not candidates and len(token) >= 5 and re.search(r"[A-Za-z][01|]+[A-Za-z]", token):
+                variants = list(delete_variants(folded))
+                rows = self.db.execute(
+                    "SELECT DISTINCT w.freq, w.word, w.folded FROM deletes d "
+                    "JOIN words w ON w.word = d.word "
+                    f"WHERE d.variant IN ({','.join('?' * len(variants))})",
+                    variants
+                ).fetchall()
+                candidates = [(freq, w) for freq, w, f in rows if within_one_edit(folded, f)]
+            candidates.sort(reverse=True)
+            if candidates and (len(candidates) == 1 or candidates[0][0] > candidates[1][0]):
+                word = candidates[0][1]
+
+        self.cache[token] = word
+        return word
+
+    def _fix_token(self, match):
+        token = match.group(0)
+
+        # A lone bar starting a sentence is the pronoun
+        if token == "|":
+            before = match.string[:match.start()].rstrip(" ")
+            after = match.string[match.end():match.end() + 2]
+            if (not before or before[-1] in "\n.!?") and re.match(r" [a-z]", after):
+                self.corrections += 1
+                return "I"
+            return token
+
+        if len(token) < 3:
+            return token
+
+        letters = sum(c.isalpha() for c in token)
+        digits = sum(c.isdigit() for c in token)
+
+        # A C long suffix (100l, 100LL) is not a misread digit
+        if re.fullmatch(r"[0-9]+[lL]{1,2}", token):
+            return token
+
+        # Mostly digits with O/l/I mixed in: a misread number
+        if digits >= 2 and digits > letters and not token.translate(NUMERIC_CONFUSIONS).strip("0123456789"):
+            fixed = token.translate(NUMERIC_CONFUSIONS)
+            if fixed != token:
+                self.corrections += 1
+            return fixed
+
+        # Other digits (utf8, sha256, x11) mark identifiers, not misreads
+        if not self.available or any(c.isdigit() and c not in "01" for c in token):
+            return token
+
+        word = self._lookup(token)
+        if word is None:
+            return token
+        self.corrections += 1
+        if token.upper() == token:
+            return word.upper()
+        if token[0].isupper():
+            return word.capitalize()
+        return word
+
+    def correct(self, text):
+        return TOKEN_RE.sub(self._fix_token, text)
+
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+
+def clean_ocr_text(text, corrector=None):
+    """
+    Clean up common OCR errors
+    """
+    if not text:
+        return text
+
+    # Remove excessive whitespace
+    lines = []
+    for line in text.split('\n'):
+        line = line.strip()
+        if line:
+            lines.append(line)
+
+    cleaned_text = '\n'.join(lines)
+
+    # Remove any trailing/leading whitespace
+    cleaned_text = cleaned_text.strip()
+
+    if corrector is not None:
+        cleaned_text = corrector.correct(cleaned_text)
 
-def enhance_image_for_ocr(temp_path):
+    return cleaned_text
+
+def iter_document_pages(path, work_dir, dpi=300):
     """
-    Enhanced image preprocessing that preserves quality
+    Yield one PNG path per page, decoding lazily so only the pages
+    currently in flight exist at any time
     """
+    if path.lower().endswith(".pdf"):
+        if not shutil.which("pdftoppm"):
+            raise RuntimeError("PDF input needs pdftoppm (poppler-utils)")
+        info = subprocess.run(["pdfinfo", path], capture_output=True, text=True, check=True)
+        pages = int(re.search(r"^Pages:\s+(\d+)", info.stdout, re.MULTILINE).group(1))
+        for page in range(1, pages + 1):
+            prefix = os.path.join(work_dir, f"page{page}")
+            subprocess.run(
+                ["pdftoppm", "-f", str(page), "-l", str(page), "-r", str(dpi),
+                 "-gray", "-png", "-singlefile", path, prefix],
+                check=True
+            )
+            yield prefix + ".png"
+        return
+
+    # Multi-page TIFF (or any single image); PIL decodes only the current frame
+    with Image.open(path) as img:
+        for page in range(getattr(img, "n_frames", 1)):
+            img.seek(page)
+            page_path = os.path.join(work_dir, f"page{page + 1}.png")
+            img.save(page_path)
+            yield page_path
+
+def ocr_document_page(page_path, config, queued_at):
+    start = time.perf_counter()
+    record_qos_metrics(jobs=1, wait_ms=(start - queued_at) * 1000)
     try:
-        img = Image.open(temp_path)
-        log_debug(f"Original image: {img.size}, mode: {img.mode}")
+        enhance_image_for_ocr(page_path, config)
+        return run_ocr_with_best_settings(page_path, None, config), time.perf_counter() - start
+    finally:
+        os.remove(page_path)
 
-        # Convert to grayscale
-        if img.mode != 'L':
-            img = img.convert('L')
+def document_command(args, config):
+    """
+    OCR a multi-page TIFF or image-only PDF, emitting text in page order
+    as soon as each prefix of pages is done
+    """
+    config = apply_content_mode(config, resolve_content_mode(config))
 
-        # Only apply enhancements if image is small or low quality
-        w, h = img.size
+    # Page-level parallelism beats Tesseract's own threading on documents
+    if not config["omp_thread_limit"]:
+        config["omp_thread_limit"] = 1
+    configure_threads(config)
+    workers = args.workers or max(1, THREAD_BUDGET.total // config["omp_thread_limit"])
+    in_flight = workers * 2
+    corrector = PostCorrector() if config["post_correction"] else None
+    out = open(args.output, "w") if args.output else sys.stdout
+    log_debug(f"=== Document OCR: {args.path}, {workers} worker(s) ===")
 
-        # Smart upscaling for small images
-        if w < 400 or h < 200:
-            scale_factor = 2 if min(w, h) < 200 else 1.5
-            new_w, new_h = int(w * scale_factor), int(h * scale_factor)
-            img = img.resize((new_w, new_h), Image.LANCZOS)
-            log_debug(f"Upscaled to: {new_w}x{new_h}")
+    def emit(page, future):
+        text, elapsed = future.result()
+        text = clean_ocr_text(text, corrector)
+        log_debug(f"Page {page}: {len(text)} chars in {elapsed:.2f}s")
+        out.write(text + "\n\f\n")
+        out.flush()
 
-        # Very gentle noise reduction (much less aggressive than before)
-        img = img.filter(ImageFilter.MedianFilter(size=3))
+    start = time.perf_counter()
+    pending = deque()
+    page_count = 0
+    try:
+        with tempfile.TemporaryDirectory(prefix="xclip-ocr-doc-") as work_dir, \
+                ThreadPoolExecutor(max_workers=workers) as pool:
+            for page_path in iter_document_pages(args.path, work_dir, args.dpi):
+                page_count += 1
+                record_qos_metrics(queue_depth=len(pending))
+                pending.append((page_count, pool.submit(
+                    ocr_document_page, page_path, config, time.perf_counter())))
+                # Finished pages at the front go out now; block only when
+                # too many pages are in flight
+                while pending and (pending[0][1].done() or len(pending) >= in_flight):
+                    emit(*pending.popleft())
+            while pending:
+                emit(*pending.popleft())
+    finally:
+        if corrector:
+            corrector.close()
+        if args.output:
+            out.close()
+        metrics = flush_qos_metrics()
+    log_debug(f"Document done: {page_count} page(s) in {time.perf_counter() - start:.1f}s, "
+              f"mean queue wait {metrics.get('wait_ms', 0) / max(1, page_count):.0f} ms, "
+              f"throttled {metrics.get('throttled_ms', 0) / 1000:.1f}s")
 
-        # Smart contrast enhancement based on image statistics
-        import numpy as np
-        img_array = np.array(img)
-        contrast = np.std(img_array)
+def ocr_session_region(temp_path, config):
+    start = time.perf_counter()
+    stats = {}
+    timings = {}
+    try:
+        text = ocr_image(temp_path, config, stats, timings)
+        timings["total"] = time.perf_counter() - start
+        return text, stats, timings
+    finally:
+        # Side files of the capture: config outputs, enhanced/light copies
+        for path in glob.glob(glob.escape(temp_path) + ".*"):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                # An abandoned speculative pass may remove its own copy first
+                pass
+        os.remove(temp_path)
 
-        if contrast < 40:  # Only enhance low-contrast images
-            enhancer = ImageEnhance.Contrast(img)
-            img = enhancer.enhance(1.3)  # Much gentler than 2.0
-            log_debug("Applied gentle contrast enhancement")
+def session_command(config, history=None):
+    """
+    Select regions one after another until the selection is aborted; each
+    region is OCR'd in the background while the next one is selected, and
+    the combined text is copied once in selection order
+    """
+    window = get_active_window_name()
+    mode = resolve_content_mode(config, window)
+    config = apply_content_mode(config, mode)
+    workers = max(1, THREAD_BUDGET.total // (config["omp_thread_limit"] or 1))
+    backend = capture_backend(config)
+    log_debug(f"=== Capture session: {mode} mode, {workers} worker(s) ===")
 
-        # Gentle sharpening instead of harsh threshold
-        img = img.filter(ImageFilter.UnsharpMask(radius=1, percent=100, threshold=3))
+    session_start = time.perf_counter()
+    pending = []
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            while not CANCEL_EVENT.is_set():
+                with tempfile.NamedTemporaryFile(suffix=backend.suffix, delete=False) as temp_img:
+                    temp_path = temp_img.name
+                # flameshot exits non-zero when the selection is aborted
+                if not capture_region(backend, temp_path, check=False):
+                    os.remove(temp_path)
+                    break
+                log_debug(f"Region {len(pending) + 1} queued: {temp_path}")
+                pending.append(pool.submit(ocr_session_region, temp_path, config))
+            selecting = time.perf_counter() - session_start
+            texts, lines = collect_region_texts(pending, config)
+    except Exception as e:
+        log_debug("Exception in capture session.")
+        log_error(e)
+        subprocess.run(
+            ["notify-send", "Text Extractor", "❌ Error occurred during OCR"],
+            env=ENV,
+        )
+        return
 
-        # Save the enhanced image
-        img.save(temp_path)
-        log_debug("Image enhancement complete")
-        return True
+    elapsed = time.perf_counter() - session_start
+    log_debug(f"Session done: {len(pending)} region(s), {selecting:.2f}s selecting, "
+              f"{elapsed:.2f}s total, power {describe_power_profile()}")
+
+    if CANCEL_EVENT.is_set():
+        log_debug("Session cancelled, leaving clipboard untouched.")
+        return
+    if not pending:
+        subprocess.run(["notify-send", "Text Extractor", "No region selected"], env=ENV)
+        return
+
+    deliver_combined_text("\n\n".join(texts), lines, f"session regions={len(pending)}",
+                          config, history, window, mode,
+                          {"selecting": selecting, "total": elapsed})
+
+def collect_region_texts(pending, config):
+    """
+    Wait for the OCR futures of a session or scroll capture in order;
+    returns the finished texts and their lines tagged with the region number
+    """
+    texts = []
+    lines = []
+    for region, future in enumerate(pending, 1):
+        try:
+            text, stats, timings = future.result()
+        except Exception as e:
+            log_debug(f"Region {region} failed.")
+            log_error(e)
+            continue
+        text = finish_text(text, config, timings)
+        log_debug(f"Region {region}: {len(text)} chars, {timings}")
+        if text:
+            texts.append(text)
+            lines += [dict(line, region=region) for line in stats.get("lines", [])]
+    return texts, lines
+
+def deliver_combined_text(text, lines, label, config, history, window, mode, timings):
+    RUN_RESULT["text"] = text
+    if not text:
+        subprocess.run(
+            ["notify-send", "Text Extractor", "❌ No text found in image"],
+            env=ENV,
+        )
+        return
+
+    stats = {"config": label, "lines": lines}
+    if lines:
+        stats["confidence"] = sum(line["conf"] for line in lines) / len(lines)
+    deliver_text(text, stats, config)
+    if history:
+        history.add({
+            "timestamp": time.time(),
+            "window": window,
+            "image_hash": None,
+            "config": f"{mode} {label}",
+            "confidence": stats.get("confidence"),
+            "timings": timings,
+            "text": text,
+        })
+
+def row_hashes(frame):
+    return [hash(row.tobytes()) for row in frame]
+
+def blank_rows(frame, tolerance=16, max_ink=0.025):
+    """
+    Rows of an RGB frame with no ink, the gaps between lines of text: at
+    most a small share of pixels (a scrollbar, a border) stands out from
+    the row's median
+    """
+    gray = frame.astype(np.int16).sum(axis=2)
+    median = np.partition(gray, gray.shape[1] // 2, axis=1)[:, gray.shape[1] // 2:][:, :1]
+    ink = np.abs(gray - median) > tolerance * 3
+    return ink.sum(axis=1) <= max_ink * frame.shape[1]
+
+def scroll_offset(previous, current, blank):
+    """
+    Rows the content moved up between two frames (negative when scrolled
+    back), voted by identical non-blank rows so a sticky header, sidebar
+    or scrollbar does not hide the scroll; None if the frames do not overlap
+    """
+    positions = {}
+    for row, value in enumerate(previous):
+        positions.setdefault(value, []).append(row)
+    votes = Counter()
+    for row, value in enumerate(current):
+        if not blank[row]:
+            # Repeated rows (rules, identical lines) vote for a few offsets only
+            for match in positions.get(value, [])[:4]:
+                votes[match - row] += 1
+    if not votes:
+        return None
+    moved = [(count, offset) for offset, count in votes.items() if offset]
+    if moved:
+        count, offset = max(moved)
+        overlap = blank[:len(blank) - offset] if offset > 0 else blank[-offset:]
+        if count >= max(4, 0.3 * (len(overlap) - overlap.sum())):
+            return offset
+    return 0 if votes[0] else None
+
+class ScrollStitcher:
+    """
+    Tracks where each frame sits in the scrolled document and hands out the
+    rows not seen before. Strips end on a blank row so no line of text is
+    cut in two; the rest waits for the next frame, or for finish().
+    """
+    def __init__(self, min_strip=8):
+        self.min_strip = min_strip
+        self.frame = None
+        self.hashes = None
+        self.top = 0       # document row of the current frame's first row
+        self.bottom = 0    # document rows before this one have been handed out
+        self.end = 0       # frame rows above a static footer
+        self.rows = 0      # rows handed out, for the work ratio
+
+    def add(self, frame):
+        """
+        Take a new frame; returns a newly revealed strip of rows or None.
+        The second value is False when the frame showed nothing new.
+        """
+        hashes = row_hashes(frame)
+        blank = blank_rows(frame)
+        if self.frame is not None:
+            if hashes == self.hashes:
+                return None, False
+            offset = scroll_offset(self.hashes, hashes, blank)
+            if offset is None:
+                # Jumped or switched page: keep what is pending, start over
+                log_debug("Scroll: no overlap with the previous frame")
+                strip = self.finish()
+                self.top = self.bottom
+                self._set(frame, hashes, len(frame))
+                return strip, True
+            if offset == 0:
+                self._set(frame, hashes, self.end)
+                return None, False
+            footer = 0
+            while footer < len(frame) - 1 and hashes[-1 - footer] == self.hashes[-1 - footer]:
+                footer += 1
+            self.top += offset
+            self._set(frame, hashes, len(frame) - footer)
+        else:
+            self._set(frame, hashes, len(frame))
+
+        start = max(0, self.bottom - self.top)
+        cut = None
+        for row in range(self.end - 1, start, -1):
+            if blank[row]:
+                cut = row
+                break
+        # No gap at all: a tall image or one huge line, take it as is
+        if cut is None and self.end - start > len(frame) // 2:
+            cut = self.end
+        if cut is None or cut - start < self.min_strip:
+            return None, True
+        return self._take(start, cut), True
+
+    def finish(self):
+        """
+        The remaining unseen rows of the last frame
+        """
+        if self.frame is None:
+            return None
+        start = max(0, self.bottom - self.top)
+        if self.end - start < self.min_strip:
+            return None
+        return self._take(start, self.end)
+
+    def _set(self, frame, hashes, end):
+        self.frame, self.hashes, self.end = frame, hashes, end
+
+    def _take(self, start, stop):
+        self.bottom = self.top + stop
+        strip = self.frame[start:stop]
+        if blank_rows(strip).all():
+            return None
+        self.rows += stop - start
+        return strip
 
+def scroll_command(config, history=None):
+    """
+    Select a region once, then scroll through it: the region is grabbed
+    repeatedly, each frame is matched against the previous one by row
+    hashes, and only the newly revealed strip is OCR'd. The strips are
+    copied as one continuous text once scrolling stops.
+    """
+    window = get_active_window_name()
+    mode = resolve_content_mode(config, window)
+    config = apply_content_mode(config, mode)
+    workers = max(1, THREAD_BUDGET.total // (config["omp_thread_limit"] or 1))
+
+    backend = capture_backend(config)
+    geometry = config["capture_region"]
+    if geometry == "last":
+        geometry = load_last_region()
+    geometry = geometry or backend.select()
+    if geometry is None:
+        subprocess.run(["notify-send", "Text Extractor", "No region selected"], env=ENV)
+        return
+    save_last_region(geometry)
+    log_debug(f"=== Scroll capture: {geometry}, {mode} mode, {workers} worker(s) ===")
+    subprocess.run(
+        ["notify-send", "Text Extractor",
+         f"📜 Scroll now; stop for {config['scroll_idle_timeout']:g}s to finish"],
+        env=ENV,
+    )
+
+    start = time.perf_counter()
+    stitcher = ScrollStitcher()
+    pending = []
+    frames = 0
+    frame_rows = 0
+    capture_time = 0
+
+    def submit(strip):
+        with tempfile.NamedTemporaryFile(suffix=".png", delete=False) as temp_img:
+            temp_path = temp_img.name
+        Image.fromarray(strip).save(temp_path)
+        log_debug(f"Scroll strip {len(pending) + 1}: {len(strip)} rows")
+        pending.append(pool.submit(ocr_session_region, temp_path, config))
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            idle_since = time.perf_counter()
+            while not CANCEL_EVENT.is_set() and frames < config["scroll_max_frames"]:
+                grab_start = time.perf_counter()
+                frame = np.asarray(backend.grab_image(geometry))
+                capture_time += time.perf_counter() - grab_start
+                frames += 1
+                frame_rows += len(frame)
+                strip, changed = stitcher.add(frame)
+                if strip is not None:
+                    submit(strip)
+                if changed:
+                    idle_since = time.perf_counter()
+                elif time.perf_counter() - idle_since >= config["scroll_idle_timeout"]:
+                    break
+                time.sleep(config["scroll_interval"])
+            strip = stitcher.finish()
+            if strip is not None:
+                submit(strip)
+            scrolling = time.perf_counter() - start
+            texts, lines = collect_region_texts(pending, config)
     except Exception as e:
-        log_debug(f"Image enhancement failed: {e}")
+        log_debug("Exception in scroll capture.")
         log_error(e)
-        return False
+        subprocess.run(
+            ["notify-send", "Text Extractor", "❌ Error occurred during OCR"],
+            env=ENV,
+        )
+        return
+
+    elapsed = time.perf_counter() - start
+    log_debug(f"Scroll capture done: {frames} frame(s), {len(pending)} strip(s), "
+              f"OCR'd {stitcher.rows} of {frame_rows} captured rows, "
+              f"{capture_time:.2f}s grabbing, {scrolling:.2f}s scrolling, {elapsed:.2f}s total, "
+              f"power {describe_power_profile()}")
+
+    if CANCEL_EVENT.is_set():
+        log_debug("Scroll capture cancelled, leaving clipboard untouched.")
+        return
+    deliver_combined_text("\n".join(texts), lines, f"scroll frames={frames} strips={len(pending)}",
+                          config, history, window, mode,
+                          {"capture": capture_time, "scrolling": scrolling, "total": elapsed})
 
-def run_ocr_with_best_settings(temp_path):
+class OcrService:
     """
-    Run OCR with optimized Tesseract settings
+    Bounded job queue in front of a fixed pool of OCR workers. A worker
+    that picks up a small image waits briefly for more small images of the
+    same content mode and OCRs them in one stacked Tesseract pass; images
+    the stacked pass finds nothing in go through the full pipeline alone.
     """
-    # Try multiple OCR approaches
-    ocr_configs = [
-        # Best for general text blocks (like UI text, paragraphs)
-        ["tesseract", temp_path, "stdout", "--psm", "6", "--oem", "1"],
 
-        # Good for mixed/sparse text (like menus, scattered text)
-        ["tesseract", temp_path, "stdout", "--psm", "11", "--oem", "1"],
+    def __init__(self, config, workers):
+        self.config = config
+        self.jobs = queue.Queue(maxsize=config["serve_queue_size"])
+        self.counters = Counter()
+        self.lock = threading.Lock()
+        self.busy = 0
+        for _ in range(workers):
+            threading.Thread(target=self._work, daemon=True).start()
 
-        # Single line text (like titles, labels)
-        ["tesseract", temp_path, "stdout", "--psm", "7", "--oem", "1"],
+    def submit(self, data, mode):
+        """
+        Queue image bytes; returns a Future of the result dict, or None
+        when the queue is full
+        """
+        job = {"data": data, "mode": mode, "queued_at": time.perf_counter(),
+               "future": Future()}
+        try:
+            self.jobs.put_nowait(job)
+        except queue.Full:
+            self._count(rejected=1)
+            return None
+        self._count(accepted=1)
+        return job["future"]
 
-        # Fallback to default
-        ["tesseract", temp_path, "stdout", "--psm", "3", "--oem", "1"]
-    ]
+    def status(self):
+        with self.lock:
+            return dict(self.counters, queued=self.jobs.qsize(), busy=self.busy,
+                        capacity=self.jobs.maxsize)
 
-    best_result = ""
-    best_length = 0
+    def _count(self, **counters):
+        with self.lock:
+            self.counters.update(counters)
 
-    for i, cmd in enumerate(ocr_configs):
+    def _work(self):
+        corrector = PostCorrector() if self.config["post_correction"] else None
+        while True:
+            jobs = [self.jobs.get()]
+            with self.lock:
+                self.busy += 1
+            workdir = tempfile.mkdtemp(prefix="xclip-ocr-serve-")
+            try:
+                self._prepare(jobs[0], workdir)
+                if jobs[0].get("small"):
+                    jobs += self._gather(jobs[0]["mode"], workdir)
+                self._run(jobs, corrector)
+            except Exception as e:
+                log_error(e)
+                for job in jobs:
+                    if not job["future"].done():
+                        job["future"].set_exception(e)
+            finally:
+                shutil.rmtree(workdir, ignore_errors=True)
+                with self.lock:
+                    self.busy -= 1
+
+    def _prepare(self, job, workdir):
+        job["started_at"] = time.perf_counter()
+        job["path"] = os.path.join(workdir, f"job{id(job)}.png")
         try:
-            log_debug(f"Trying OCR config {i+1}: PSM={cmd[4]}")
+            with Image.open(io.BytesIO(job["data"])) as img:
+                img.save(job["path"])
+                size = img.size
+        except Exception as e:
+            job["error"] = f"not an image: {e}"
+            return
+        job["small"] = size[0] * size[1] <= self.config["serve_batch_max_pixels"]
 
-            result = subprocess.run(
-                cmd,
-                capture_output=True,
-                text=True,
-                env=ENV,
-                timeout=20
-            )
+    def _gather(self, mode, workdir):
+        """
+        Small jobs of the same mode arriving within the batch window; other
+        jobs taken meanwhile are run after the batch, one by one
+        """
+        deadline = time.perf_counter() + self.config["serve_batch_wait_ms"] / 1000
+        gathered = []
+        while len(gathered) < self.config["serve_batch_size"] - 1:
+            try:
+                job = self.jobs.get(timeout=max(0, deadline - time.perf_counter()))
+            except queue.Empty:
+                break
+            self._prepare(job, workdir)
+            gathered.append(job)
+        return gathered
 
-            text = result.stdout.strip()
+    def _run(self, jobs, corrector):
+        for job in jobs:
+            if "error" in job:
+                job["future"].set_exception(ValueError(job["error"]))
+        batch = [job for job in jobs if "error" not in job and job["small"]
+                 and job["mode"] == jobs[0]["mode"]]
+        if len(batch) < 2:
+            batch = []
+        try:
+            if batch:
+                self._run_batch(batch, corrector)
+        except Exception as e:
+            log_debug(f"Service: batch of {len(batch)} failed, running alone: {e}")
+            for job in batch:
+                job.pop("result", None)
+        batched = sum(1 for job in batch if "result" in job)
+        for job in jobs:
+            if "error" in job or "result" in job:
+                continue
+            try:
+                self._run_single(job, corrector)
+            except Exception as e:
+                log_error(e)
+                job["future"].set_exception(e)
+        for job in jobs:
+            if "result" in job:
+                job["result"]["timings"]["queue"] = job["started_at"] - job["queued_at"]
+                job["future"].set_result(job["result"])
+        self._count(jobs=sum(1 for job in jobs if "error" not in job),
+                    batches=int(batched > 0), batched_jobs=batched)
 
-            if text and len(text) > best_length:
-                best_result = text
-                best_length = len(text)
-                log_debug(f"Config {i+1} found {len(text)} characters")
+    def _run_batch(self, batch, corrector):
+        config = apply_content_mode(self.config, batch[0]["mode"])
+        start = time.perf_counter()
+        images = []
+        for job in batch:
+            enhance_image_for_ocr(job["path"], config)
+            with Image.open(job["path"]) as img:
+                images.append(img.convert('L'))
+        preprocess = time.perf_counter() - start
+        start = time.perf_counter()
+        results = ocr_stacked(images, config)
+        ocr = time.perf_counter() - start
+        for job, lines in zip(batch, results):
+            if not lines:
+                # Nothing found when stacked: give it the full multi-PSM run
+                continue
+            timings = {"preprocess": preprocess / len(batch), "ocr": ocr / len(batch)}
+            text = "\n".join(line["text"] for line in lines)
+            start = time.perf_counter()
+            text = clean_ocr_text(text, corrector)
+            timings["postprocess"] = time.perf_counter() - start
+            job["result"] = {
+                "text": text,
+                "confidence": sum(line["conf"] for line in lines) / len(lines),
+                "config": f"psm=6 stacked={len(batch)}",
+                "timings": timings,
+            }
 
-                # If first config works well, use it
-                if i == 0 and len(text) > 5:
-                    break
+    def _run_single(self, job, corrector):
+        # tsv output for the confidence, from the same recognition pass
+        config = dict(apply_content_mode(self.config, job["mode"]), save_formats=["tsv"])
+        stats = {}
+        timings = {}
+        start = time.perf_counter()
+        enhance_image_for_ocr(job["path"], config)
+        timings["preprocess"] = time.perf_counter() - start
+        start = time.perf_counter()
+        text = run_ocr_with_best_settings(job["path"], stats, config)
+        timings["ocr"] = time.perf_counter() - start
+        if "output_base" in stats and os.path.exists(stats["output_base"] + ".tsv"):
+            with open(stats["output_base"] + ".tsv") as f:
+                lines = parse_tsv_lines(f.read())
+            if lines:
+                stats["confidence"] = sum(line["conf"] for line in lines) / len(lines)
+        start = time.perf_counter()
+        text = clean_ocr_text(text, corrector)
+        timings["postprocess"] = time.perf_counter() - start
+        job["result"] = {
+            "text": text,
+            "confidence": stats.get("confidence"),
+            "config": stats.get("config"),
+            "timings": timings,
+        }
 
-        except subprocess.TimeoutExpired:
-            log_debug(f"Config {i+1} timed out")
-            continue
+class OcrRequestHandler(BaseHTTPRequestHandler):
+    """
+    POST /ocr?mode=MODE with image bytes as the body returns JSON text,
+    confidence, config and per-stage timings; GET /status returns the
+    queue counters. A full queue is answered with 429 and Retry-After.
+    """
+    service = None
+    max_bytes = 0
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != "/ocr":
+            return self._reply(404, {"error": "unknown path"})
+        mode = parse_qs(url.query).get("mode", ["text"])[0]
+        if mode not in CONTENT_MODES:
+            return self._reply(400, {"error": f"unknown mode {mode}"})
+        length = int(self.headers.get("Content-Length") or 0)
+        if not length:
+            return self._reply(400, {"error": "empty body"})
+        if length > self.max_bytes:
+            return self._reply(413, {"error": "image too large"})
+        future = self.service.submit(self.rfile.read(length), mode)
+        if future is None:
+            return self._reply(429, {"error": "busy"}, {"Retry-After": "1"})
+        try:
+            self._reply(200, future.result())
+        except ValueError as e:
+            self._reply(400, {"error": str(e)})
         except Exception as e:
-            log_debug(f"Config {i+1} failed: {e}")
-            continue
+            self._reply(500, {"error": str(e)})
 
-    return best_result
+    def do_GET(self):
+        if urlparse(self.path).path != "/status":
+            return self._reply(404, {"error": "unknown path"})
+        self._reply(200, self.service.status())
+
+    def _reply(self, code, body, headers=None):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
 
-def clean_ocr_text(text):
+    def address_string(self):
+        # Unix socket peers have no address
+        return self.client_address[0] if self.client_address else "local"
+
+    def log_message(self, format, *args):
+        log_debug("Service: " + format % args)
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+def serve_command(args, config):
     """
-    Clean up common OCR errors
+    Run the OCR service on a Unix socket (default) or a localhost TCP port
+    until interrupted
     """
-    if not text:
-        return text
+    config = dict(config)
+    if not config["omp_thread_limit"]:
+        config["omp_thread_limit"] = 1
+    configure_threads(config)
+    workers = config["serve_workers"] or max(1, THREAD_BUDGET.total // config["omp_thread_limit"])
 
-    # Remove excessive whitespace
-    lines = []
-    for line in text.split('\n'):
-        line = line.strip()
-        if line:
-            lines.append(line)
+    handler = type("Handler", (OcrRequestHandler,), {
+        "service": OcrService(config, workers),
+        "max_bytes": config["serve_max_mb"] * 1024 * 1024,
+    })
+    if args.port:
+        server = ThreadingHTTPServer(("127.0.0.1", args.port), handler)
+        endpoint = f"http://127.0.0.1:{args.port}"
+    else:
+        path = args.socket or SERVICE_SOCKET
+        if os.path.exists(path):
+            os.remove(path)
+        server = UnixHTTPServer(path, handler)
+        os.chmod(path, 0o600)
+        endpoint = path
+    log_debug(f"=== OCR service on {endpoint}: {workers} worker(s), "
+              f"queue {config['serve_queue_size']} ===")
+    print(f"Serving OCR on {endpoint}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if not args.port and os.path.exists(endpoint):
+            os.remove(endpoint)
+        log_debug(f"Service stopped: {handler.service.status()}")
 
-    cleaned_text = '\n'.join(lines)
+def copy_to_clipboard(text, mime_type=None):
+    target = ["-t", mime_type] if mime_type else []
+    try:
+        subprocess.run(
+            ["xclip", "-selection", "clipboard"] + target,
+            input=text.encode("utf-8"),
+            check=True,
+            env=ENV,
+        )
+        log_debug("Text copied using xclip.")
+    except Exception:
+        log_debug("xclip failed, trying xsel...")
+        try:
+            subprocess.run(
+                ["xsel", "--clipboard"],
+                input=text.encode("utf-8"),
+                check=True,
+                env=ENV,
+            )
+            log_debug("Text copied using xsel.")
+        except Exception as e2:
+            log_debug("xsel also failed.")
+            log_error(e2)
 
-    # Remove any trailing/leading whitespace
-    cleaned_text = cleaned_text.strip()
+def own_clipboard(targets):
+    """
+    Serve several targets of the CLIPBOARD selection at once ({target:
+    text}, e.g. text/plain and text/html), which xclip cannot. A forked
+    child owns the selection through python-xlib until another client
+    takes it, as xclip's own background process does. Returns False when
+    python-xlib or the display is unavailable.
+    """
+    try:
+        from Xlib import X, Xatom, display
+        from Xlib.protocol import event as xevent
+    except ImportError:
+        return False
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid:
+        os.close(write_fd)
+        with os.fdopen(read_fd, "rb") as ready:
+            owned = ready.read(1) == b"1"
+        log_debug(f"Clipboard targets {sorted(targets)} {'served' if owned else 'unavailable'}")
+        return owned
 
-    return cleaned_text
+    # Child: drop inherited descriptors (the instance lock above all)
+    os.closerange(3, write_fd)
+    os.closerange(write_fd + 1, resource.getrlimit(resource.RLIMIT_NOFILE)[0])
+    try:
+        os.setsid()
+        d = display.Display()
+        window = d.screen().root.create_window(0, 0, 1, 1, 0, X.CopyFromParent)
+        clipboard = d.intern_atom("CLIPBOARD")
+        targets_atom = d.intern_atom("TARGETS")
+        data = {d.intern_atom(name): text.encode("utf-8") for name, text in targets.items()}
+        window.set_selection_owner(clipboard, X.CurrentTime)
+        d.sync()
+        if d.get_selection_owner(clipboard) != window:
+            os._exit(1)
+        os.write(write_fd, b"1")
+        os.close(write_fd)
+        while True:
+            request = d.next_event()
+            if request.type == X.SelectionClear:
+                break
+            if request.type != X.SelectionRequest:
+                continue
+            prop = request.property or request.target
+            if request.target == targets_atom:
+                request.requestor.change_property(prop, Xatom.ATOM, 32,
+                                                  [targets_atom] + list(data))
+            elif request.target in data:
+                request.requestor.change_property(prop, request.target, 8,
+                                                  data[request.target])
+            else:
+                prop = X.NONE
+            request.requestor.send_event(xevent.SelectionNotify(
+                time=request.time, requestor=request.requestor,
+                selection=request.selection, target=request.target, property=prop))
+            d.flush()
+    except Exception:
+        pass
+    os._exit(0)
 
 def main():
-    with tempfile.NamedTemporaryFile(suffix=".png", delete=False) as temp_img:
+    parser = argparse.ArgumentParser(description="Screen region OCR to clipboard")
+    parser.add_argument("--on-busy", choices=["cancel", "queue", "attach"],
+                        help="Overlap policy when a previous run is still busy")
+    parser.add_argument("--mode", choices=["auto"] + list(CONTENT_MODES),
+                        help="Content mode (overrides content_mode from the config)")
+    parser.add_argument("--format", choices=["text", "html", "json"],
+                        help="Clipboard format (overrides clipboard_format)")
+    parser.add_argument("--save", metavar="FORMATS",
+                        help="Comma-separated files to write: txt,tsv,hocr,json")
+    parser.add_argument("--output-dir", help="Directory for --save files")
+    parser.add_argument("--backend", choices=list(CAPTURE_BACKENDS),
+                        help="Capture backend (overrides capture_backend)")
+    parser.add_argument("--region", metavar="WxH+X+Y|last",
+                        help="Capture this region, or the last one, without selecting")
+    parser.add_argument("--qos", choices=QOS_CLASSES,
+                        help="Scheduling class (default: background for document and "
+                             "serve, which cannot run interactive; interactive otherwise)")
+    subparsers = parser.add_subparsers(dest="command")
+
+    history_parser = subparsers.add_parser("history", help="Search or re-copy past extractions")
+    history_parser.add_argument("query", nargs="*", help="Full-text search terms")
+    history_parser.add_argument("--limit", type=int, default=20, help="Maximum results")
+    history_parser.add_argument("--copy", type=int, metavar="ID", help="Copy entry ID to the clipboard")
+
+    dictionary_parser = subparsers.add_parser(
+        "dictionary", help="Rebuild the post-correction index from the word list and history")
+    dictionary_parser.add_argument("--words", help="Word list (one word per line)")
+
+    document_parser = subparsers.add_parser(
+        "document", help="OCR a multi-page TIFF or image-only PDF")
+    document_parser.add_argument("path", help="TIFF, PDF or image file")
+    document_parser.add_argument("--output", "-o", help="Write text here instead of stdout")
+    document_parser.add_argument("--workers", type=int, help="Pages OCR'd in parallel")
+    document_parser.add_argument("--dpi", type=int, default=300, help="PDF rasterization DPI")
+
+    subparsers.add_parser(
+        "session", help="Select several regions in a row, copy all their text at once")
+    subparsers.add_parser(
+        "scroll", help="Select a region, scroll through it, copy its text as one piece")
+
+    serve_parser = subparsers.add_parser(
+        "serve", help="Serve OCR to local tools: POST image bytes to /ocr, get JSON back")
+    serve_parser.add_argument("--socket", help=f"Unix socket path (default {SERVICE_SOCKET})")
+    serve_parser.add_argument("--port", type=int, help="Listen on 127.0.0.1:PORT instead")
+
+    replay_parser = subparsers.add_parser(
+        "replay", help="List recorded captures, or re-run one and diff latency and output")
+    replay_parser.add_argument("recording", nargs="?", help="Recording name, prefix or 'last'")
+    replay_parser.add_argument("--current-config", action="store_true",
+                               help="Use today's config instead of the recorded one")
+    replay_parser.add_argument("--set", action="append", default=[], metavar="KEY=VALUE",
+                               help="Override a config key (JSON value), e.g. binarization=\"wolf\"")
+
+    args = parser.parse_args()
+    config = load_config()
+    if args.mode:
+        config["content_mode"] = args.mode
+    if args.format:
+        config["clipboard_format"] = args.format
+    if args.save is not None:
+        config["save_formats"] = [fmt for fmt in args.save.split(",") if fmt]
+    if args.output_dir:
+        config["output_dir"] = args.output_dir
+    if args.backend:
+        config["capture_backend"] = args.backend
+    if args.region:
+        if args.region != "last":
+            try:
+                parse_geometry(args.region)
+            except ValueError as e:
+                parser.error(str(e))
+        config["capture_region"] = args.region
+
+    if args.command == "history":
+        history_command(args)
+        return
+    if args.command == "replay":
+        replay_command(args, config)
+        return
+    if args.command == "dictionary":
+        count = build_dictionary_index(args.words or config["dictionary_words"])
+        print(f"Indexed {count} words into {DICTIONARY_DB}")
+        return
+    config = apply_power_profile(config)
+    long_running = args.command in ("document", "serve")
+    if long_running and args.qos == "interactive":
+        # The interactive class holds the QoS lock until the process exits,
+        # which would stall every hotkey run behind a batch or the service
+        parser.error(f"{args.command} cannot run in the interactive QoS class")
+    qos = args.qos or ("background" if long_running else "interactive")
+    if args.command == "document":
+        document_command(args, enter_qos_class(qos, config))
+        return
+    if args.command == "serve":
+        serve_command(args, enter_qos_class(qos, config))
+        return
+
+    start = time.perf_counter()
+    policy = args.on_busy or config["overlap_policy"]
+
+    lock_file, attached_text = coordinate_with_running_instance(policy)
+    if lock_file is None:
+        log_debug(f"Attached to running instance ({len(attached_text)} chars)")
+        if attached_text:
+            print(attached_text)
+        return
+
+    config = enter_qos_class(qos, config)
+    record_qos_metrics(jobs=1, wait_ms=(time.perf_counter() - start) * 1000)
+    configure_threads(config)
+    history = HistoryWriter(config) if config["history_enabled"] else None
+
+    start_control_server()
+    try:
+        if args.command == "session":
+            session_command(config, history)
+        elif args.command == "scroll":
+            scroll_command(config, history)
+        else:
+            capture_and_ocr(config, history)
+    finally:
+        RESULT_EVENT.set()
+        release_instance_lock(lock_file)
+        flush_qos_metrics()
+        if history:
+            history.close()
+
+def parse_geometry(geometry):
+    """
+    (width, height, x, y) of a WxH+X+Y geometry string
+    """
+    match = re.fullmatch(r"(\d+)x(\d+)\+(-?\d+)\+(-?\d+)", geometry.strip())
+    if not match:
+        raise ValueError(f"Invalid region {geometry!r}, expected WxH+X+Y")
+    return tuple(int(n) for n in match.groups())
+
+def load_last_region():
+    try:
+        with open(LAST_REGION_PATH) as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+def save_last_region(geometry):
+    os.makedirs(os.path.dirname(LAST_REGION_PATH), exist_ok=True)
+    with open(LAST_REGION_PATH, "w") as f:
+        f.write(geometry + "\n")
+
+class FlameshotBackend:
+    """
+    Capture through flameshot: its own selection overlay, the region comes
+    back PNG-encoded on stdout
+    """
+    suffix = ".png"
+
+    def capture(self, temp_path, check=True):
+        """
+        Interactive selection and capture; returns (selected, geometry),
+        geometry None because flameshot does not report it
+        """
+        with open(temp_path, "wb") as out:
+            subprocess.run(["flameshot", "gui", "-r"], stdout=out, check=check)
+        return os.path.getsize(temp_path) > 0, None
+
+    def select(self):
+        """
+        Let the user select a region without capturing it; returns its
+        geometry as WxH+X+Y, or None if the selection was aborted
+        """
+        result = subprocess.run(["flameshot", "gui", "--print-geometry"],
+                                capture_output=True, text=True)
+        numbers = re.findall(r"-?\d+", result.stdout)
+        if result.returncode != 0 or len(numbers) < 4:
+            return None
+        width, height, x, y = numbers[:4]
+        return f"{width}x{height}+{x}+{y}"
+
+    def grab(self, geometry, temp_path):
+        with open(temp_path, "wb") as out:
+            subprocess.run(["flameshot", "full", "--region", geometry, "-r"],
+                           stdout=out, check=True)
+
+    def grab_image(self, geometry):
+        """
+        Capture a fixed region with no user interaction, as an RGB image
+        """
+        result = subprocess.run(["flameshot", "full", "--region", geometry, "-r"],
+                                capture_output=True, check=True)
+        return Image.open(io.BytesIO(result.stdout)).convert('RGB')
+
+class X11Backend:
+    """
+    In-process XGetImage of the root window through python-xlib: no helper
+    process to launch and no PNG encoding. Captures are written as
+    uncompressed PPM, which PIL and Tesseract read without decoding work.
+    Regions are selected with a rubber band drawn on the root window.
+    """
+    suffix = ".ppm"
+
+    def __init__(self):
+        try:
+            from Xlib import X, XK, display
+        except ImportError as e:
+            raise RuntimeError('capture_backend "x11" needs python-xlib '
+                               '(pip install python-xlib)') from e
+        self.X = X
+        self.XK = XK
+        self.display = display.Display()
+        self.root = self.display.screen().root
+
+    def capture(self, temp_path, check=True):
+        geometry = self.select()
+        if geometry is None:
+            return False, None
+        self.grab(geometry, temp_path)
+        return True, geometry
+
+    def select(self):
+        X = self.X
+        font = self.display.open_font("cursor")
+        # XC_crosshair and its mask glyph
+        cursor = font.create_glyph_cursor(font, 34, 35, (65535, 65535, 65535), (0, 0, 0))
+        gc = self.root.create_gc(function=X.GXinvert, subwindow_mode=X.IncludeInferiors,
+                                 line_width=1)
+        grabbed = self.root.grab_pointer(
+            False, X.ButtonPressMask | X.ButtonReleaseMask | X.PointerMotionMask,
+            X.GrabModeAsync, X.GrabModeAsync, X.NONE, cursor, X.CurrentTime)
+        if grabbed != X.GrabSuccess:
+            log_debug(f"X11 selection: pointer grab failed ({grabbed})")
+            return None
+        self.root.grab_keyboard(False, X.GrabModeAsync, X.GrabModeAsync, X.CurrentTime)
+
+        start = None
+        shown = None
+
+        def band(rect):
+            # Drawn with GXinvert, so drawing the same band again erases it
+            if rect:
+                self.root.rectangle(gc, *rect)
+                self.display.flush()
+
+        try:
+            while True:
+                event = self.display.next_event()
+                if event.type == X.KeyPress and \
+                        self.display.keycode_to_keysym(event.detail, 0) == self.XK.XK_Escape:
+                    band(shown)
+                    return None
+                if event.type == X.ButtonPress:
+                    start = (event.root_x, event.root_y)
+                elif start and event.type in (X.MotionNotify, X.ButtonRelease):
+                    x, y = min(start[0], event.root_x), min(start[1], event.root_y)
+                    rect = (x, y, abs(event.root_x - start[0]), abs(event.root_y - start[1]))
+                    band(shown)
+                    shown = None
+                    if event.type == X.ButtonRelease:
+                        if rect[2] < 2 or rect[3] < 2:
+                            return None
+                        return f"{rect[2]}x{rect[3]}+{x}+{y}"
+                    band(rect)
+                    shown = rect
+        finally:
+            self.display.ungrab_pointer(X.CurrentTime)
+            self.display.ungrab_keyboard(X.CurrentTime)
+            self.display.flush()
+
+    def grab(self, geometry, temp_path):
+        self.grab_image(geometry).save(temp_path, "PPM")
+
+    def grab_image(self, geometry):
+        width, height, x, y = parse_geometry(geometry)
+        screen = self.root.get_geometry()
+        # XGetImage fails on regions reaching outside the screen; a clipped
+        # left or top edge shortens the region by the part cut off
+        width, height = width + min(0, x), height + min(0, y)
+        x, y = max(0, x), max(0, y)
+        width, height = min(width, screen.width - x), min(height, screen.height - y)
+        if width <= 0 or height <= 0:
+            raise RuntimeError(f"Region {geometry} is outside the screen")
+        reply = self.root.get_image(x, y, width, height, self.X.ZPixmap, 0xffffffff)
+        if reply.depth not in (24, 32):
+            raise RuntimeError(f"Unsupported X visual depth {reply.depth}")
+        lsb_first = self.display.display.info.image_byte_order == self.X.LSBFirst
+        return Image.frombuffer("RGB", (width, height), reply.data, "raw",
+                                "BGRX" if lsb_first else "XRGB", 0, 1)
+
+CAPTURE_BACKENDS = {"flameshot": FlameshotBackend, "x11": X11Backend}
+
+def capture_backend(config):
+    """
+    The configured capture backend, falling back to flameshot when the
+    x11 one cannot start (no python-xlib, no X display)
+    """
+    try:
+        return CAPTURE_BACKENDS[config["capture_backend"]]()
+    except Exception as e:
+        log_debug(f"Capture backend {config['capture_backend']} unavailable ({e}), "
+                  f"using flameshot")
+        return FlameshotBackend()
+
+def capture_region(backend, temp_path, region=None, check=True):
+    """
+    Capture into temp_path: a fixed region (WxH+X+Y, or "last" for the
+    last remembered one) without interaction, otherwise the user's
+    selection. False if nothing was selected.
+    """
+    if region == "last":
+        region = load_last_region()
+        if region is None:
+            log_debug("No last region remembered yet, selecting instead")
+    if region:
+        backend.grab(region, temp_path)
+        save_last_region(region)
+        return True
+    selected, geometry = backend.capture(temp_path, check)
+    if geometry:
+        save_last_region(geometry)
+    return selected
+
+def ocr_image(temp_path, config, stats, timings, app="unknown"):
+    """
+    Pre-check, preprocess and OCR one captured image; returns the raw text
+    """
+    if config["text_precheck"]:
+        start = time.perf_counter()
+        maybe_text, features = detect_text_presence(temp_path)
+        timings["precheck"] = time.perf_counter() - start
+        log_debug(f"Text pre-check in {timings['precheck'] * 1000:.1f} ms: {features}")
+        if not maybe_text:
+            log_debug("Pre-check found no text, skipping OCR.")
+            return ""
+
+    text = None
+    # tsv/hocr files must come from one regular recognition pass
+    fast_paths = not set(config["save_formats"]) & {"tsv", "hocr"}
+    line_cache = LineCache(config) if fast_paths and config["line_cache"] else None
+    try:
+        if line_cache:
+            start = time.perf_counter()
+            text = line_cache.recognize(temp_path, stats)
+            timings["line_cache"] = time.perf_counter() - start
+        if text is None:
+            text = run_ocr_pipeline(temp_path, config, stats, timings, app, fast_paths)
+            if line_cache:
+                line_cache.learn(stats)
+    finally:
+        if line_cache:
+            line_cache.close()
+    return text
+
+def run_ocr_pipeline(temp_path, config, stats, timings, app, fast_paths):
+    text = None
+    if fast_paths and cascade_available(config):
+        log_debug("Running fast/best model cascade...")
+        start = time.perf_counter()
+        text = run_ocr_cascade(temp_path, stats, config)
+        timings["cascade"] = time.perf_counter() - start
+    elif fast_paths and speculation_enabled(config, app):
+        log_debug("Racing raw-capture OCR against preprocessing...")
+        start = time.perf_counter()
+        text = run_ocr_speculative(temp_path, stats, config, app)
+        timings["speculative"] = time.perf_counter() - start
+
+    if text is None:
+        # Enhanced preprocessing (less aggressive than current version)
+        log_debug("Applying enhanced image processing...")
+        start = time.perf_counter()
+        enhance_image_for_ocr(temp_path, config)
+        timings["preprocess"] = time.perf_counter() - start
+
+        if CANCEL_EVENT.is_set():
+            log_debug("Run cancelled before OCR.")
+            return ""
+
+        # Run OCR with multiple configurations
+        log_debug("Running OCR with optimized settings...")
+        start = time.perf_counter()
+        text = run_ocr_with_best_settings(temp_path, stats, config)
+        timings["ocr"] = time.perf_counter() - start
+    log_debug(f"OCR tried {stats.get('configs_tried', 0)} config(s)")
+
+    if "output_base" in stats and "lines" not in stats \
+            and os.path.exists(stats["output_base"] + ".tsv"):
+        with open(stats["output_base"] + ".tsv") as f:
+            stats["lines"] = parse_tsv_lines(f.read())
+        if stats["lines"]:
+            stats["confidence"] = (sum(line["conf"] for line in stats["lines"])
+                                   / len(stats["lines"]))
+    return text
+
+def finish_text(text, config, timings):
+    """
+    Whitespace cleanup and post-correction of raw OCR text
+    """
+    corrector = PostCorrector() if config["post_correction"] else None
+    start = time.perf_counter()
+    text = clean_ocr_text(text, corrector)
+    timings["postprocess"] = time.perf_counter() - start
+    if corrector:
+        log_debug(f"Post-correction fixed {corrector.corrections} token(s)")
+        corrector.close()
+    return text
+
+def deliver_text(text, stats, config):
+    """
+    Copy the result to the clipboard in the configured format, write any
+    requested files and notify
+    """
+    if config["clipboard_format"] == "html":
+        html_text = render_html(text, stats.get("lines"))
+        # Plain text alongside, so terminals and plain fields still paste
+        if not own_clipboard({"text/html": html_text, "text/plain": text,
+                              "text/plain;charset=utf-8": text, "UTF8_STRING": text}):
+            log_debug("Could not serve text/html (needs python-xlib and X); copying text/plain only")
+            copy_to_clipboard(text)
+    elif config["clipboard_format"] == "json":
+        copy_to_clipboard(render_json(text, stats))
+    else:
+        copy_to_clipboard(text)
+    for path in write_outputs(text, stats, config):
+        log_debug(f"Wrote {path}")
+
+    # Enhanced notification with character count
+    char_count = len(text)
+    word_count = len(text.split())
+    subprocess.run(
+        ["notify-send", "Text Extracted",
+         f"✅ {char_count} chars, {word_count} words copied"],
+        env=ENV,
+    )
+
+def capture_and_ocr(config, history=None):
+    backend = capture_backend(config)
+    with tempfile.NamedTemporaryFile(suffix=backend.suffix, delete=False) as temp_img:
         temp_path = temp_img.name
 
+    timings = {}
+    stats = {}
+    recorder = FlightRecorder(config) if config["flight_recorder"] else None
+
     try:
         log_debug("=== Starting Enhanced xclip-ocr ===")
+        # Read before flameshot's overlay takes focus
+        window = get_active_window_name()
+        mode = resolve_content_mode(config, window)
+        config = apply_content_mode(config, mode)
+        log_debug(f"Content mode: {mode}")
         log_debug("Starting screenshot capture...")
 
-        subprocess.run(
-            ["flameshot", "gui", "-r"],
-            stdout=open(temp_path, "wb"),
-            check=True
-        )
+        start = time.perf_counter()
+        selected = capture_region(backend, temp_path, config["capture_region"])
+        timings["capture"] = time.perf_counter() - start
         log_debug(f"Screenshot saved to {temp_path}")
 
-        if os.path.getsize(temp_path) == 0:
+        if not selected:
             subprocess.run(
                 ["notify-send", "Text Extractor", "No region selected"],
                 env=ENV
@@ -167,50 +3583,47 @@ def main():
             log_debug("No region selected, file is empty.")
             return
 
-        # Enhanced preprocessing (less aggressive than current version)
-        log_debug("Applying enhanced image processing...")
-        enhance_image_for_ocr(temp_path)
+        image_hash = hash_file(temp_path) if history else None
+        app = app_name_from_title(window)
+        if recorder:
+            recorder.save_raw(temp_path)
+            recorder.record.update(window=window, app=app, mode=mode, config=config)
 
-        # Run OCR with multiple configurations
-        log_debug("Running OCR with optimized settings...")
-        text = run_ocr_with_best_settings(temp_path)
+        text = ocr_image(temp_path, config, stats, timings, app)
+
+        if CANCEL_EVENT.is_set():
+            log_debug("Run cancelled, leaving clipboard untouched.")
+            return
 
         # Clean up the text
-        text = clean_ocr_text(text)
+        raw_text = text
+        text = finish_text(text, config, timings)
+        RUN_RESULT["text"] = text
+        if recorder:
+            recorder.record.update(raw_text=raw_text, text=text, power=dict(POWER_PROFILE))
 
         log_debug(f"Final OCR result ({len(text)} chars):\n{text}")
+        log_debug("Timings: " + ", ".join(f"{stage} {sec * 1000:.0f} ms"
+                                          for stage, sec in timings.items())
+                  + f"; power {describe_power_profile()}")
+        profile = POWER_PROFILE["profile"]
+        record_stats(**{f"power_captures:{profile}": 1,
+                        f"power_ocr_ms:{profile}": round(1000 * sum(
+                            sec for stage, sec in timings.items() if stage != "capture"))})
 
         if text:
-            try:
-                subprocess.run(
-                    ["xclip", "-selection", "clipboard"],
-                    input=text.encode("utf-8"),
-                    check=True,
-                    env=ENV,
-                )
-                log_debug("Text copied using xclip.")
-            except Exception:
-                log_debug("xclip failed, trying xsel...")
-                try:
-                    subprocess.run(
-                        ["xsel", "--clipboard"],
-                        input=text.encode("utf-8"),
-                        check=True,
-                        env=ENV,
-                    )
-                    log_debug("Text copied using xsel.")
-                except Exception as e2:
-                    log_debug("xsel also failed.")
-                    log_error(e2)
-
-            # Enhanced notification with character count
-            char_count = len(text)
-            word_count = len(text.split())
-            subprocess.run(
-                ["notify-send", "Text Extracted",
-                 f"✅ {char_count} chars, {word_count} words copied"],
-                env=ENV,
-            )
+            deliver_text(text, stats, config)
+
+            if history:
+                history.add({
+                    "timestamp": time.time(),
+                    "window": window,
+                    "image_hash": image_hash,
+                    "config": f"{mode} {stats.get('config')}",
+                    "confidence": stats.get("confidence"),
+                    "timings": timings,
+                    "text": text,
+                })
         else:
             log_debug("No text found by OCR.")
             subprocess.run(
@@ -221,12 +3634,23 @@ def main():
     except Exception as e:
         log_debug("Exception in main flow.")
         log_error(e)
+        if recorder:
+            recorder.record["error"] = traceback.format_exc()
         subprocess.run(
             ["notify-send", "Text Extractor", "❌ Error occurred during OCR"],
             env=ENV,
         )
 
     finally:
+        if recorder:
+            recorder.finish(temp_path, timings, stats)
+        # Side files of the capture: config outputs, enhanced/light copies
+        for path in glob.glob(glob.escape(temp_path) + ".*"):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                # An abandoned speculative pass may remove its own copy first
+                pass
         if os.path.exists(temp_path):
             os.remove(temp_path)
             log_debug(f"Deleted temp file: {temp_path}")